@@ -0,0 +1,10 @@
+""" Настройки тестов проекта для pytest: те же, что у manage.py test """
+import pytest
+
+
+@pytest.fixture(scope='session', autouse=True)
+def project_test_settings(django_test_environment):
+    from core.test_runner import isolated_settings
+
+    with isolated_settings():
+        yield
@@ -0,0 +1,207 @@
+import hashlib
+import math
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+# префикс ключей, в которых хранятся версии тегов
+TAG_PREFIX = 'tag:'
+# префикс и имена счётчиков кеша страниц
+STATS_PREFIX = 'cache_stats:'
+STATS = ('recomputed', 'early', 'coalesced')
+# шаг ожидания страницы, которую строит другой запрос, в секундах
+WAIT_STEP = 0.05
+
+
+def _tag_key(tag):
+    return f'{TAG_PREFIX}{tag}'
+
+
+def _new_version():
+    # версия из времени не повторяет старую, даже если ключ тега вытеснили
+    return time.time_ns()
+
+
+def tag_versions(tags):
+    """ Текущие версии тегов одним обращением к кешу """
+    keys = {_tag_key(tag): tag for tag in tags}
+    found = cache.get_many(keys)
+    versions = {}
+    for key, tag in keys.items():
+        version = found.get(key)
+        if version is None:
+            version = _new_version()
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+        versions[tag] = version
+    return versions
+
+
+def bump_tag(tag):
+    """ Сбрасывает тег и возвращает его новую версию """
+    key = _tag_key(tag)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = _new_version()
+        cache.set(key, version, None)
+        return version
+
+
+def bump_tags(*tags):
+    """ Делает недействительными все записи кеша, помеченные тегами """
+    for tag in set(tags):
+        bump_tag(tag)
+
+
+def tags_version(tags):
+    """ Строка из версий тегов для ключа кеша или фрагмента шаблона """
+    versions = tag_versions(tags)
+    return '.'.join(str(versions[tag]) for tag in sorted(versions))
+
+
+def tagged_key(prefix, tags, *parts):
+    """ Ключ кеша, меняющийся при сбросе любого из тегов """
+    raw = ':'.join([tags_version(tags), *map(str, parts)])
+    return f'{prefix}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def count_stat(name):
+    """ Увеличивает счётчик работы кеша страниц """
+    key = f'{STATS_PREFIX}{name}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def cache_stats():
+    """ Значения счётчиков кеша страниц """
+    found = cache.get_many(f'{STATS_PREFIX}{name}' for name in STATS)
+    return {name: found.get(f'{STATS_PREFIX}{name}', 0) for name in STATS}
+
+
+def page_key(view_name, request):
+    """ Ключ страницы без версий тегов: старая копия остаётся доступной """
+    raw = f'{request.get_full_path()}:{request.user.pk}'
+    return f'page:{view_name}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def refresh_early(entry, now, beta=None):
+    """ Пора ли пересчитать свежую страницу досрочно (алгоритм XFetch).
+
+    Вероятность растёт к концу срока свежести и тем быстрее, чем дольше
+    страница строилась, поэтому пересчёт начинает один запрос, а не все
+    разом в момент истечения.
+    """
+    if beta is None:
+        beta = settings.TAGGED_CACHE_EARLY_BETA
+    gap = entry['delta'] * beta * -math.log(1.0 - random.random())
+    return now + gap >= entry['expires']
+
+
+def _wait_for_entry(key, version):
+    """ Ждёт, пока страницу построит запрос, взявший блокировку """
+    deadline = time.monotonic() + settings.TAGGED_CACHE_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_STEP)
+        entry = cache.get(key)
+        if entry is not None and entry['version'] == version:
+            return entry
+    return None
+
+
+def record_shown(request, versions):
+    """ Запоминает версии тегов данных, показанных на странице.
+
+    Страница в кеше устаревает, когда сбрасывают любой из этих тегов,
+    а не только теги самой страницы. Вне кешируемой страницы ничего не
+    делает.
+    """
+    shown = getattr(request, '_shown_tags', None)
+    if shown is not None:
+        shown.update(versions)
+
+
+def _is_fresh(entry, page_version, versions):
+    return (entry['version'] == page_version
+            and all(versions[tag] == version
+                    for tag, version in entry.get('shown', {}).items()))
+
+
+def _rebuild(key, version, timeout, view, request, *args, **kwargs):
+    """ Строит страницу и кладёт её в кеш вместе с временем построения """
+    started = time.monotonic()
+    request._shown_tags = {}
+    response = view(request, *args, **kwargs)
+    if response.status_code == 200 and not response.streaming:
+        if hasattr(response, 'render'):
+            response.render()
+        cache.set(key, {
+            'version': version,
+            'shown': request._shown_tags,
+            'response': response,
+            'expires': time.time() + timeout,
+            'delta': time.monotonic() - started,
+        }, timeout + settings.TAGGED_CACHE_STALE)
+    return response
+
+
+def cache_page_tagged(tags, timeout=None):
+    """ Кеширует ответ view, пока не сброшен один из его тегов.
+
+    ``tags`` — функция от аргументов view, возвращающая список тегов.
+    Ключ учитывает полный URL и пользователя, поэтому в кеше не
+    смешиваются страницы разных посетителей. Страница устаревает и при
+    сбросе тегов показанных на ней данных (см. ``record_shown``).
+
+    Устаревшую страницу пересчитывает один запрос — тот, кто взял
+    блокировку; остальные в это время получают прежнюю копию. Незадолго
+    до конца срока свежести страница с небольшой вероятностью
+    пересчитывается досрочно.
+    """
+    if timeout is None:
+        timeout = settings.TAGGED_CACHE_TIMEOUT
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            page_tags = tags(request, *args, **kwargs)
+            key = page_key(view.__name__, request)
+            entry = cache.get(key)
+            # версии тегов страницы и показанных на ней данных — одним
+            # обращением к кешу
+            shown = entry.get('shown', {}) if entry is not None else {}
+            versions = tag_versions([*page_tags, *shown])
+            version = '.'.join(str(versions[tag])
+                               for tag in sorted(set(page_tags)))
+            now = time.time()
+            early = False
+            if (entry is not None and _is_fresh(entry, version, versions)
+                    and now < entry['expires']):
+                if not refresh_early(entry, now):
+                    return entry['response']
+                early = True
+            lock = f'{key}:lock'
+            if not cache.add(lock, 1, settings.TAGGED_CACHE_LOCK_TIMEOUT):
+                # страницу уже строит другой запрос
+                entry = entry or _wait_for_entry(key, version)
+                if entry is None:
+                    return view(request, *args, **kwargs)
+                count_stat('coalesced')
+                return entry['response']
+            try:
+                response = _rebuild(key, version, timeout,
+                                    view, request, *args, **kwargs)
+                count_stat('early' if early else 'recomputed')
+            finally:
+                cache.delete(lock)
+            return response
+        return wrapper
+    return decorator
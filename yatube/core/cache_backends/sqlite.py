@@ -0,0 +1,230 @@
+""" Кеш Django в файле SQLite, общий для всех процессов на сервере.
+
+В отличие от LocMemCache записи видят все воркеры, поэтому доля попаданий
+не падает с ростом числа процессов, а сброс тегов в одном процессе сразу
+действует в остальных. Внешний сервис (memcached, redis) не нужен.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# сколько ключей подставлять в один запрос IN (...)
+KEYS_PER_QUERY = 500
+# как часто (в записях одного процесса) проверять размер кеша
+CULL_EVERY = 32
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    stored REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires);
+CREATE INDEX IF NOT EXISTS cache_stored ON cache (stored);
+"""
+
+
+def _dump(value):
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def _load(value):
+    return pickle.loads(value)
+
+
+class SQLiteCache(BaseCache):
+    """ Бэкенд кеша поверх SQLite в режиме WAL.
+
+    Каждый поток каждого процесса держит своё соединение. ``add`` — один
+    UPSERT, ``incr`` и ``set_many`` идут в транзакции BEGIN IMMEDIATE,
+    поэтому операции атомарны между процессами. Размер ограничен
+    ``MAX_ENTRIES``: сначала удаляются просроченные записи, затем самые
+    давние.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        options = params.get('OPTIONS', {})
+        self._busy_timeout = options.get('BUSY_TIMEOUT', 5)
+        self._local = threading.local()
+
+    def _connection(self):
+        pid = os.getpid()
+        connection = getattr(self._local, 'connection', None)
+        # после fork соединение родителя использовать нельзя
+        if connection is None or self._local.pid != pid:
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self._path,
+                timeout=self._busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+            self._local.pid = pid
+            self._local.writes = 0
+        return connection
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _after_write(self, count=1):
+        self._local.writes += count
+        if self._local.writes >= CULL_EVERY:
+            self._local.writes = 0
+            self._cull()
+
+    def _cull(self):
+        connection = self._connection()
+        connection.execute(
+            'DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        (total,) = connection.execute(
+            'SELECT COUNT(*) FROM cache').fetchone()
+        if total <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            connection.execute('DELETE FROM cache')
+            return
+        # как и в бэкендах Django, удаляем долю записей, но самых давних
+        connection.execute(
+            'DELETE FROM cache WHERE key IN ('
+            'SELECT key FROM cache ORDER BY stored LIMIT ?)',
+            (max(total - self._max_entries,
+                 total // self._cull_frequency),)
+        )
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        cursor = self._connection().execute(
+            'INSERT INTO cache (key, value, expires, stored) '
+            'VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, '
+            'expires = excluded.expires, stored = excluded.stored '
+            'WHERE cache.expires <= ?',
+            (key, _dump(value), self.get_backend_timeout(timeout), now, now)
+        )
+        added = cursor.rowcount == 1
+        if added:
+            self._after_write()
+        return added
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        row = self._connection().execute(
+            'SELECT value FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (key, time.time())
+        ).fetchone()
+        return default if row is None else _load(row[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        rows = [(self._key(key, version), _dump(value), expires, now)
+                for key, value in data.items()]
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache (key, value, expires, stored) '
+                'VALUES (?, ?, ?, ?)',
+                rows
+            )
+        self._after_write(len(rows))
+        return []
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        found = {}
+        names = list(keys)
+        now = time.time()
+        connection = self._connection()
+        for start in range(0, len(names), KEYS_PER_QUERY):
+            chunk = names[start:start + KEYS_PER_QUERY]
+            rows = connection.execute(
+                'SELECT key, value FROM cache WHERE key IN (%s) '
+                'AND (expires IS NULL OR expires > ?)'
+                % ', '.join('?' * len(chunk)),
+                (*chunk, now)
+            )
+            for name, value in rows:
+                found[keys[name]] = _load(value)
+        return found
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        cursor = self._connection().execute(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, time.time())
+        )
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        name = self._key(key, version)
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (name, time.time())
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = _load(row[0]) + delta
+            connection.execute(
+                'UPDATE cache SET value = ? WHERE key = ?',
+                (_dump(value), name)
+            )
+        return value
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        row = self._connection().execute(
+            'SELECT 1 FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (key, time.time())
+        ).fetchone()
+        return row is not None
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        cursor = self._connection().execute(
+            'DELETE FROM cache WHERE key = ?', (key,))
+        return cursor.rowcount == 1
+
+    def delete_many(self, keys, version=None):
+        names = [self._key(key, version) for key in keys]
+        connection = self._connection()
+        for start in range(0, len(names), KEYS_PER_QUERY):
+            chunk = names[start:start + KEYS_PER_QUERY]
+            connection.execute(
+                'DELETE FROM cache WHERE key IN (%s)'
+                % ', '.join('?' * len(chunk)),
+                chunk
+            )
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # соединение живёт всё время работы потока, как у LocMemCache
+        pass
@@ -0,0 +1,152 @@
+""" Отдача файлов с диска.
+
+Файл отдаётся через FileResponse: WSGI-сервер с ``wsgi.file_wrapper``
+(gunicorn, uWSGI) передаёт его через sendfile, не читая в Python.
+Поддерживаются запросы Range и условные запросы по ETag и
+Last-Modified.
+"""
+import mimetypes
+import os
+import re
+import stat
+
+from django.http import (FileResponse, Http404, HttpResponse,
+                         HttpResponseNotModified)
+from django.utils.http import http_date, parse_http_date_safe
+
+# Range: bytes=начало-конец, bytes=начало- или bytes=-длина_хвоста
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# год: максимум, который рекомендует RFC 7234
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class RangeFile:
+    """ Открытый файл, из которого читается не больше ``length`` байт.
+
+    ``fileno`` остаётся доступен: sendfile начнёт с текущей позиции и
+    возьмёт Content-Length байт.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def content_type(name):
+    """ MIME-тип по имени файла; сжатые файлы — как двоичные """
+    content_type, encoding = mimetypes.guess_type(name)
+    if encoding or content_type is None:
+        # сжатый файл отдаём как есть, без Content-Encoding
+        return 'application/octet-stream'
+    return content_type
+
+
+def _etag(stat_result):
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def _not_modified(request, etag, mtime):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        return if_none_match.strip() == '*' or etag in [
+            tag.strip() for tag in if_none_match.split(',')]
+    since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE'))
+    return since is not None and int(mtime) <= since
+
+
+def _byte_range(request, etag, size):
+    """ (начало, конец) из заголовка Range, None — отдать файл целиком.
+
+    Для диапазона за концом файла возвращает False.
+    """
+    header = request.META.get('HTTP_RANGE')
+    if not header or size == 0:
+        return None
+    # If-Range с устаревшим ETag: файл изменился, отдаём целиком
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range is not None and if_range.strip() != etag:
+        return None
+    match = RANGE.match(header.replace(' ', ''))
+    if match is None:
+        # несколько диапазонов не поддерживаются, их можно не выполнять
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last or int(last) == 0:
+            return False
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _file_response(request, full_path, etag, size, mime_type):
+    byte_range = _byte_range(request, etag, size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    file = open(full_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=mime_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(RangeFile(file, start, length),
+                                status=206, content_type=mime_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = length
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def stat_file(full_path):
+    """ stat обычного файла; для каталога или отсутствующего файла — 404 """
+    try:
+        stat_result = os.stat(full_path)
+    except (OSError, ValueError):
+        raise Http404('Файл не найден')
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise Http404('Файл не найден')
+    return stat_result
+
+
+def send_file(request, full_path, cache_control, mime_type=None,
+              offload=None, stat_result=None):
+    """ Ответ с файлом ``full_path`` или 304, если он не изменился.
+
+    ``offload`` — функция, возвращающая пустой ответ, байты которого
+    отдаст веб-сервер перед приложением.
+    """
+    if stat_result is None:
+        stat_result = stat_file(full_path)
+    if mime_type is None:
+        mime_type = content_type(full_path)
+    etag = _etag(stat_result)
+    if _not_modified(request, etag, stat_result.st_mtime):
+        response = HttpResponseNotModified()
+    elif offload is not None:
+        response = offload()
+    else:
+        response = _file_response(request, full_path, etag,
+                                  stat_result.st_size, mime_type)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat_result.st_mtime)
+    response['Cache-Control'] = cache_control
+    return response
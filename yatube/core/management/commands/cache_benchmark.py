@@ -0,0 +1,78 @@
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from core.cache_backends.sqlite import SQLiteCache
+
+# размер значения, похожий на закешированный фрагмент ленты
+PAYLOAD = 'x' * 4096
+
+
+def _worker(cache, operations, keys, seed, results):
+    """ Читает случайные ключи, при промахе пересчитывает и кладёт в кеш """
+    rnd = random.Random(seed)
+    hits = 0
+    started = time.perf_counter()
+    for number in range(operations):
+        key = f'bench:{rnd.randrange(keys)}'
+        if cache.get(key) is None:
+            cache.set(key, PAYLOAD, 300)
+        else:
+            hits += 1
+        if number % 10 == 0:
+            try:
+                cache.incr('bench:counter')
+            except ValueError:
+                cache.add('bench:counter', 1, None)
+    results.put((hits, time.perf_counter() - started))
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает LocMemCache и общий SQLite-кеш под нагрузкой из '
+            'нескольких процессов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--operations', type=int, default=5000,
+                            help='Операций на процесс')
+        parser.add_argument('--keys', type=int, default=1000,
+                            help='Число различных ключей')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            backends = (
+                ('LocMemCache', LocMemCache('benchmark', {
+                    'OPTIONS': {'MAX_ENTRIES': options['keys'] * 2}})),
+                ('SQLiteCache', SQLiteCache(
+                    os.path.join(directory, 'benchmark.sqlite3'),
+                    {'OPTIONS': {'MAX_ENTRIES': options['keys'] * 2}})),
+            )
+            for name, cache in backends:
+                self._run(name, cache, options)
+
+    def _run(self, name, cache, options):
+        # fork: процессы получают копию бэкенда, как воркеры gunicorn
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        processes = [
+            context.Process(target=_worker, args=(
+                cache, options['operations'], options['keys'], seed, results))
+            for seed in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+        collected = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        total = options['operations'] * options['processes']
+        hits = sum(hits for hits, _ in collected)
+        elapsed = max(seconds for _, seconds in collected)
+        self.stdout.write(
+            f'{name}: {total / elapsed:.0f} оп/с, '
+            f'попаданий {hits / total:.1%}'
+        )
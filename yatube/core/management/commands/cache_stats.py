@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from core.cache import cache_stats
+
+
+class Command(BaseCommand):
+    help = ('Показывает, сколько раз страницы пересчитывались и сколько '
+            'запросов получили готовую копию, пока страницу строил другой')
+
+    def handle(self, *args, **options):
+        stats = cache_stats()
+        self.stdout.write(
+            f'Пересчитано: {stats["recomputed"]}, '
+            f'досрочно: {stats["early"]}, '
+            f'объединено: {stats["coalesced"]}'
+        )
@@ -0,0 +1,48 @@
+""" Отдача файлов из MEDIA_ROOT.
+
+Если перед приложением стоит nginx или Apache, байты может отдать он
+сам по заголовку X-Accel-Redirect или X-Sendfile.
+"""
+import re
+from functools import partial
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404, HttpResponse
+from django.utils._os import safe_join
+from django.views.decorators.http import require_safe
+
+from .files import IMMUTABLE_CACHE_CONTROL, content_type, send_file
+
+
+def cache_control(path):
+    """ Заголовок Cache-Control для файла из MEDIA_ROOT """
+    for pattern in settings.MEDIA_IMMUTABLE_PATTERNS:
+        if re.match(pattern, path):
+            # имя меняется вместе с содержимым, файл можно не перепроверять
+            return IMMUTABLE_CACHE_CONTROL
+    return f'public, max-age={settings.MEDIA_MAX_AGE}'
+
+
+def _offloaded(path, full_path):
+    """ Пустой ответ, байты которого отдаст веб-сервер перед приложением """
+    response = HttpResponse(content_type=content_type(full_path))
+    if settings.MEDIA_ACCEL_REDIRECT:
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT + path
+    else:
+        response['X-Sendfile'] = full_path
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """ Файл из MEDIA_ROOT с поддержкой Range и условных запросов """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Файл не найден')
+    offload = None
+    if settings.MEDIA_ACCEL_REDIRECT or settings.MEDIA_X_SENDFILE:
+        offload = partial(_offloaded, path, full_path)
+    return send_file(request, full_path, cache_control(path),
+                     offload=offload)
@@ -0,0 +1,141 @@
+""" Статика с хешем в имени и заранее сжатыми копиями.
+
+collectstatic сохраняет файлы под именами с хешем содержимого
+(ManifestStaticFilesStorage) и рядом кладёт сжатые копии: ``.gz`` и, если
+установлен пакет brotli, ``.br``. ``serve_static`` отдаёт сжатую копию
+по заголовку Accept-Encoding и разрешает кешировать файлы с хешем
+в имени навсегда, а остальные — на ``STATIC_MAX_AGE`` секунд.
+"""
+import gzip
+import os
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import (ManifestStaticFilesStorage,
+                                                staticfiles_storage)
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404
+from django.utils._os import safe_join
+from django.views.decorators.http import require_safe
+
+from .files import (IMMUTABLE_CACHE_CONTROL, content_type, send_file,
+                    stat_file)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# что сжимать: картинки PNG/JPEG и шрифты WOFF уже сжаты
+COMPRESSIBLE = ('.css', '.js', '.svg', '.ico', '.txt', '.json', '.map',
+                '.xml', '.html')
+# файлы меньше этого размера сжатие почти не уменьшает
+MIN_SIZE = 256
+
+
+def _gzip(data):
+    # mtime=0: одинаковый файл даёт одинаковый архив при каждой сборке
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _encoders():
+    """ Кодировки в порядке предпочтения: (Content-Encoding, суффикс) """
+    encoders = []
+    if brotli is not None:
+        encoders.append(('br', '.br', brotli.compress))
+    encoders.append(('gzip', '.gz', _gzip))
+    return encoders
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ Манифест с хешами имён и сжатые копии файлов """
+
+    def post_process(self, paths, dry_run=False, **options):
+        processed = super().post_process(paths, dry_run, **options)
+        for name, hashed_name, done in processed:
+            yield name, hashed_name, done
+            if (dry_run or isinstance(done, Exception)
+                    or not hashed_name):
+                continue
+            self.compress(hashed_name)
+
+    def compress(self, name):
+        """ Кладёт рядом с файлом его сжатые копии, если они меньше """
+        if not name.endswith(COMPRESSIBLE):
+            return
+        path = self.path(name)
+        with open(path, 'rb') as file:
+            data = file.read()
+        if len(data) < MIN_SIZE:
+            return
+        for _, suffix, encode in _encoders():
+            compressed = encode(data)
+            if len(compressed) < len(data) * 0.95:
+                with open(path + suffix, 'wb') as file:
+                    file.write(compressed)
+
+    def stored_name(self, name):
+        # до collectstatic (при разработке и в тестах) манифеста нет:
+        # файлы отдаются под своими именами и кешируются ненадолго. Если
+        # манифест загружен, файл не из него — ошибка сборки, а не повод
+        # тихо отдать имя без хеша
+        if settings.DEBUG or not self.hashed_files:
+            try:
+                return super().stored_name(name)
+            except ValueError:
+                return name
+        return super().stored_name(name)
+
+
+def _accepted(request):
+    """ Кодировки из Accept-Encoding, кроме запрещённых через q=0 """
+    accepted = set()
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = part.partition(';')
+        params = params.replace(' ', '')
+        if params.startswith('q='):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+@lru_cache(maxsize=1)
+def _hashed_names():
+    """ Имена с хешем из манифеста, загруженного при старте процесса """
+    return frozenset(getattr(staticfiles_storage, 'hashed_files', {})
+                     .values())
+
+
+def _precompressed(request, full_path):
+    """ Сжатая копия, которую принимает клиент: (путь, Content-Encoding) """
+    accepted = _accepted(request)
+    for coding, suffix, _ in _encoders():
+        if coding in accepted and os.path.isfile(full_path + suffix):
+            return full_path + suffix, coding
+    return full_path, None
+
+
+@require_safe
+def serve_static(request, path):
+    """ Файл из STATIC_ROOT, по возможности заранее сжатый """
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Файл не найден')
+    # сжатые копии лежат только рядом с существующими файлами
+    stat_file(full_path)
+    if path in _hashed_names():
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        cache_control = f'public, max-age={settings.STATIC_MAX_AGE}'
+    served_path, encoding = _precompressed(request, full_path)
+    response = send_file(request, served_path, cache_control,
+                         mime_type=content_type(full_path))
+    if encoding is not None:
+        response['Content-Encoding'] = encoding
+    response['Vary'] = 'Accept-Encoding'
+    return response
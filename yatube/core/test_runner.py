@@ -0,0 +1,50 @@
+""" Запуск тестов проекта с отдельным кешем, медиа и без фоновых потоков.
+
+Кеш по умолчанию — файл SQLite, общий для всех процессов сервера. Тесты
+очищают кеш, поэтому им подставляется свой кеш в памяти процесса: файл
+разработки остаётся нетронутым, а параллельные прогоны не мешают друг
+другу. Загрузки и миниатюры пишутся во временный MEDIA_ROOT, а не в
+медиа разработки, и строятся сразу, а не в пуле: иначе потоки пула
+пишут в каталог, который тест уже удаляет.
+
+Настройки подставляет и ``manage.py test`` (``TEST_RUNNER``), и pytest
+(фикстура в conftest.py в корне репозитория).
+"""
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+TEST_SETTINGS = {
+    'CACHES': {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'tests',
+        },
+    },
+    'THUMBNAIL_BACKGROUND': False,
+}
+
+
+@contextmanager
+def isolated_settings():
+    """ Настройки тестов на время прогона """
+    media_root = tempfile.mkdtemp(prefix='yatube-media-')
+    try:
+        with override_settings(MEDIA_ROOT=media_root, **TEST_SETTINGS):
+            yield
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._test_settings = isolated_settings()
+        self._test_settings.__enter__()
+
+    def teardown_test_environment(self, **kwargs):
+        self._test_settings.__exit__(None, None, None)
+        super().teardown_test_environment(**kwargs)
@@ -1,6 +1,23 @@
-from django.test import TestCase
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
 from http import HTTPStatus
 
+from .cache import (bump_tags, cache_page_tagged, cache_stats, page_key,
+                    refresh_early, tag_versions, tagged_key)
+from .cache_backends.sqlite import CULL_EVERY, SQLiteCache
+from .staticfiles import _hashed_names
+
 
 class ViewTestClass(TestCase):
     def test_error_page(self):
@@ -9,3 +26,227 @@ class ViewTestClass(TestCase):
         expected_template = 'core/404.html'
         self.assertEqual(response.status_code, expected_status_code)
         self.assertTemplateUsed(response, expected_template)
+
+
+class TagCacheTestClass(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_bump_changes_only_tagged_keys(self):
+        first_key = tagged_key('test', ['first'], 'page')
+        second_key = tagged_key('test', ['second'], 'page')
+        self.assertEqual(first_key, tagged_key('test', ['first'], 'page'))
+        bump_tags('first')
+        self.assertNotEqual(first_key, tagged_key('test', ['first'], 'page'))
+        self.assertEqual(second_key, tagged_key('test', ['second'], 'page'))
+
+    def test_evicted_tag_gets_new_version(self):
+        version = tag_versions(['first'])['first']
+        cache.clear()
+        self.assertNotEqual(tag_versions(['first'])['first'], version)
+
+
+class PageCacheTestClass(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+        @cache_page_tagged(lambda request: ['page'])
+        def view(request):
+            self.calls += 1
+            return HttpResponse(f'version {self.calls}')
+
+        self.view = view
+        self.request = RequestFactory().get('/page/')
+        self.request.user = AnonymousUser()
+
+    def test_stale_copy_served_while_page_is_rebuilt(self):
+        self.assertEqual(self.view(self.request).content, b'version 1')
+        bump_tags('page')
+        # страницу уже строит другой запрос
+        lock = f'{page_key("view", self.request)}:lock'
+        cache.add(lock, 1)
+        self.assertEqual(self.view(self.request).content, b'version 1')
+        self.assertEqual(self.calls, 1)
+        cache.delete(lock)
+        self.assertEqual(self.view(self.request).content, b'version 2')
+        self.assertEqual(cache_stats(),
+                         {'recomputed': 2, 'early': 0, 'coalesced': 1})
+
+    def test_refresh_early_near_expiry(self):
+        now = time.time()
+        with mock.patch('core.cache.random.random', return_value=0.5):
+            # ln(2) * 10 секунд пересчёта ≈ 7 секунд запаса
+            self.assertTrue(refresh_early(
+                {'delta': 10, 'expires': now + 5}, now, beta=1))
+            self.assertFalse(refresh_early(
+                {'delta': 10, 'expires': now + 60}, now, beta=1))
+
+
+def _increment(cache, times):
+    for _ in range(times):
+        cache.incr('counter')
+
+
+class SQLiteCacheTestClass(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = SQLiteCache(
+            os.path.join(self.directory, 'cache.sqlite3'),
+            {'OPTIONS': {'MAX_ENTRIES': 10}},
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_basic_operations(self):
+        self.cache.set('key', {'value': 1})
+        self.assertEqual(self.cache.get('key'), {'value': 1})
+        self.assertFalse(self.cache.add('key', 2))
+        self.assertTrue(self.cache.add('other', 2))
+        self.cache.set_many({'first': 1, 'second': 2})
+        self.assertEqual(
+            self.cache.get_many(['first', 'second', 'missing']),
+            {'first': 1, 'second': 2},
+        )
+        self.cache.delete_many(['first', 'second'])
+        self.assertIsNone(self.cache.get('first'))
+
+    def test_expired_entry_is_missing(self):
+        self.cache.set('key', 'value', 0)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 'new'))
+        self.assertEqual(self.cache.get('key'), 'new')
+
+    def test_incr_is_atomic_between_processes(self):
+        self.cache.set('counter', 0, None)
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=_increment,
+                                     args=(self.cache, 50))
+                     for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+
+    def test_size_is_bounded(self):
+        for number in range(CULL_EVERY * 2):
+            self.cache.set(f'key_{number}', number)
+        self.assertLessEqual(
+            len(self.cache.get_many(
+                [f'key_{number}' for number in range(CULL_EVERY * 2)])),
+            10 + CULL_EVERY,
+        )
+        # остаются самые свежие записи
+        self.assertEqual(self.cache.get(f'key_{CULL_EVERY * 2 - 1}'),
+                         CULL_EVERY * 2 - 1)
+
+
+class MediaServeTestClass(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.directory, 'cache'))
+        for name in ('file.txt', 'cache/thumb.jpg'):
+            with open(os.path.join(self.directory, name), 'wb') as file:
+                file.write(b'0123456789')
+        settings = override_settings(MEDIA_ROOT=self.directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def test_full_and_conditional_response(self):
+        response = self.client.get('/media/file.txt')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        response = self.client.get('/media/file.txt',
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_range_requests(self):
+        response = self.client.get('/media/file.txt', HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, HTTPStatus.PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        response = self.client.get('/media/file.txt', HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+        response = self.client.get('/media/file.txt', HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code,
+                         HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+        # If-Range со старым ETag: файл целиком
+        response = self.client.get('/media/file.txt', HTTP_RANGE='bytes=2-5',
+                                   HTTP_IF_RANGE='"old"')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_thumbnails_cached_forever(self):
+        response = self.client.get('/media/cache/thumb.jpg')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+
+    def test_paths_outside_media_root_not_found(self):
+        for path in ('/media/../manage.py', '/media/cache/',
+                     '/media/missing.txt'):
+            with self.subTest(path=path):
+                self.assertEqual(self.client.get(path).status_code,
+                                 HTTPStatus.NOT_FOUND)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT='/protected/')
+    def test_accel_redirect(self):
+        response = self.client.get('/media/file.txt')
+        self.assertEqual(response['X-Accel-Redirect'],
+                         '/protected/file.txt')
+        self.assertEqual(response.content, b'')
+
+
+class StaticServeTestClass(TestCase):
+    CSS = 'vendor/bootstrap/5.1.3/css/bootstrap.min.css'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.mkdtemp()
+        cls.settings = override_settings(STATIC_ROOT=cls.directory)
+        cls.settings.enable()
+        call_command('collectstatic', interactive=False, verbosity=0)
+        _hashed_names.cache_clear()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings.disable()
+        _hashed_names.cache_clear()
+        shutil.rmtree(cls.directory, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_collectstatic_hashes_and_compresses(self):
+        name = staticfiles_storage.stored_name(self.CSS)
+        self.assertNotEqual(name, self.CSS)
+        path = os.path.join(self.directory, name)
+        self.assertTrue(os.path.isfile(path + '.gz'))
+        self.assertLess(os.path.getsize(path + '.gz'), os.path.getsize(path))
+
+    def test_precompressed_copy_served(self):
+        url = staticfiles_storage.url(self.CSS)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertIn('immutable', response['Cache-Control'])
+        response = self.client.get(url)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_file_missing_from_manifest_is_an_error(self):
+        with self.assertRaises(ValueError):
+            staticfiles_storage.stored_name('css/missing.css')
+        with override_settings(DEBUG=True):
+            self.assertEqual(
+                staticfiles_storage.stored_name('css/missing.css'),
+                'css/missing.css')
+
+    def test_unhashed_name_cached_briefly(self):
+        response = self.client.get(f'/static/{self.CSS}')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        self.assertEqual(self.client.get('/static/../manage.py').status_code,
+                         HTTPStatus.NOT_FOUND)
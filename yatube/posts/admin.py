@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import Group, Post, Comment, Follow
+from .search import match_expression, matching_ids
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -16,7 +17,8 @@ class PostAdmin(admin.ModelAdmin):
     )
     # поля ссылки на пост
     list_display_links = ('pk', 'text',)
-    # Добавляем интерфейс для поиска по тексту постов
+    # Добавляем интерфейс для поиска по тексту постов; ищет полнотекстовый
+    # индекс, см. get_search_results
     search_fields = ('text',)
     # Добавляем возможность фильтрации по дате
     list_filter = ('pub_date',)
@@ -24,6 +26,13 @@ class PostAdmin(admin.ModelAdmin):
     # эта строка
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        """ Поиск по индексу FTS5 вместо LIKE '%q%' по всей таблице """
+        expression = match_expression(search_term)
+        if not expression:
+            return queryset, False
+        return queryset.filter(pk__in=matching_ids(expression)), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = (
@@ -44,6 +53,7 @@ class CommentAdmin(admin.ModelAdmin):
         'text',
         'created',
         'post',
+        'parent',
     )
 
 
@@ -0,0 +1,273 @@
+""" Подсказки по началу имени пользователя и названия группы.
+
+Индекс живёт в памяти процесса: отсортированный список ключей, поиск по
+префиксу — двоичный поиск и проход по соседним элементам, без запросов
+к базе. Сигналы моделей правят индекс своего процесса на месте, сдвигают
+версию тега ``AUTOCOMPLETE_TAG`` и кладут в кеш само изменение под этой
+версией. Остальные процессы, увидев новую версию, применяют пропущенные
+изменения по порядку; с нуля индекс строится в фоновом потоке, только
+если изменение потерялось или их накопилось слишком много.
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from core.cache import bump_tag, tag_versions
+
+from .models import Group
+
+User = get_user_model()
+
+AUTOCOMPLETE_TAG = 'autocomplete'
+USER = 'user'
+GROUP = 'group'
+# сколько подсказок отдавать по умолчанию и не больше скольких вообще
+LIMIT = 10
+MAX_LIMIT = 50
+# как часто сверять версию индекса с кешем, в секундах: между проверками
+# подсказки не обращаются ни к базе, ни к кешу
+CHECK_INTERVAL = 1.0
+# изменения индекса в кеше: ключ с версией тега и срок хранения
+CHANGE_PREFIX = 'autocomplete:change:'
+CHANGE_TIMEOUT = 60 * 60
+# при большем отставании индекс дешевле построить заново
+MAX_PENDING = 1000
+
+
+def normalize(text):
+    """ Ключ для сравнения: без регистра, «ё» совпадает с «е» """
+    return text.casefold().replace('ё', 'е')
+
+
+def user_entry(user):
+    """ Ключи и данные подсказки для пользователя """
+    name = ' '.join(part for part in (user.first_name, user.last_name)
+                    if part)
+    keys = {normalize(user.username)}
+    keys.update(normalize(word) for word in name.split())
+    return keys, {'username': user.username, 'name': name}
+
+
+def group_entry(group):
+    """ Ключи и данные подсказки для группы: название и каждое его слово """
+    title = normalize(group.title)
+    keys = {title, normalize(group.slug), *title.split()}
+    return keys, {'title': group.title, 'slug': group.slug}
+
+
+class PrefixIndex:
+    """ Отсортированный список ``(ключ, вид, id)`` и данные подсказок """
+
+    def __init__(self):
+        self.keys = []
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def add(self, kind, pk, keys, data):
+        with self.lock:
+            self._remove((kind, pk))
+            self.entries[kind, pk] = (keys, data)
+            for key in keys:
+                insort(self.keys, (key, kind, pk))
+
+    def remove(self, kind, pk):
+        with self.lock:
+            self._remove((kind, pk))
+
+    def _remove(self, entry):
+        keys, _ = self.entries.pop(entry, (set(), None))
+        for key in keys:
+            position = bisect_left(self.keys, (key, *entry))
+            if (position < len(self.keys)
+                    and self.keys[position] == (key, *entry)):
+                del self.keys[position]
+
+    @classmethod
+    def from_entries(cls, entries):
+        """ Индекс из записей ``(вид, id, ключи, данные)``.
+
+        Ключи собираются в список и сортируются один раз, а не вставляются
+        по одному.
+        """
+        index = cls()
+        for kind, pk, keys, data in entries:
+            index.entries[kind, pk] = (keys, data)
+            index.keys.extend((key, kind, pk) for key in keys)
+        index.keys.sort()
+        return index
+
+    def search(self, prefix, kind=None, limit=LIMIT):
+        """ Данные подсказок, ключ которых начинается с ``prefix`` """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        # у одной записи несколько ключей: показываем её один раз
+        found = {}
+        with self.lock:
+            keys = self.keys
+            position = bisect_left(keys, (prefix,))
+            while position < len(keys) and len(found) < limit:
+                key, entry_kind, pk = keys[position]
+                if not key.startswith(prefix):
+                    break
+                position += 1
+                if kind is None or entry_kind == kind:
+                    found.setdefault(
+                        (entry_kind, pk), self.entries[entry_kind, pk][1])
+        return [(entry_kind, data)
+                for (entry_kind, _), data in found.items()]
+
+
+_index = None
+# версия тега, до которой применены изменения, время последней сверки и
+# версия, изменения которой не нашлось в кеше при прошлой сверке
+_version = None
+_checked = 0.0
+_stalled = None
+_lock = threading.RLock()
+# поток, строящий индекс заново
+_rebuilding = None
+
+
+def _current_version():
+    return tag_versions([AUTOCOMPLETE_TAG])[AUTOCOMPLETE_TAG]
+
+
+def _change_key(version):
+    return f'{CHANGE_PREFIX}{version}'
+
+
+def _entries():
+    users = User.objects.filter(is_active=True).only(
+        'pk', 'username', 'first_name', 'last_name')
+    for user in users.iterator():
+        yield (USER, user.pk, *user_entry(user))
+    for group in Group.objects.only('pk', 'title', 'slug').iterator():
+        yield (GROUP, group.pk, *group_entry(group))
+
+
+def build():
+    """ Строит индекс по всем активным пользователям и группам """
+    return PrefixIndex.from_entries(_entries())
+
+
+def _rebuild():
+    """ Строит индекс в фоне; до замены подсказки идут по старому """
+    global _index, _version, _stalled
+    try:
+        # версия читается до чтения базы: более поздние изменения
+        # применятся к новому индексу при следующей сверке
+        version = _current_version()
+        index = build()
+        with _lock:
+            _index, _version, _stalled = index, version, None
+    finally:
+        connection.close()
+
+
+def _start_rebuild():
+    global _rebuilding
+    if _rebuilding is not None and _rebuilding.is_alive():
+        return
+    _rebuilding = threading.Thread(target=_rebuild, daemon=True)
+    _rebuilding.start()
+
+
+def _catch_up(version):
+    """ Применяет к индексу изменения других процессов до ``version`` """
+    global _version, _stalled
+    if version < _version or version - _version > MAX_PENDING:
+        # тег вытеснен из кеша или процесс слишком отстал
+        _start_rebuild()
+        return
+    pending = range(_version + 1, version + 1)
+    changes = cache.get_many([_change_key(number) for number in pending])
+    for number in pending:
+        change = changes.get(_change_key(number))
+        if change is None:
+            # изменение могли ещё не записать; если его нет и при
+            # следующей сверке — оно потеряно
+            if _stalled == number:
+                _start_rebuild()
+            _stalled = number
+            return
+        method, args = change
+        getattr(_index, method)(*args)
+        _version = number
+
+
+def get_index():
+    """ Индекс процесса, догнавший изменения других процессов.
+
+    С нуля индекс строится в запросе только при первом обращении: до
+    этого подсказывать нечем.
+    """
+    global _index, _version, _checked
+    now = time.monotonic()
+    if _index is not None and now - _checked < CHECK_INTERVAL:
+        return _index
+    version = _current_version()
+    with _lock:
+        if _index is None:
+            _index = build()
+            _version = version
+        elif version != _version:
+            _catch_up(version)
+        _checked = now
+        return _index
+
+
+def forget():
+    """ Забывает индекс процесса: следующий запрос построит его заново """
+    global _index, _stalled
+    with _lock:
+        _index = _stalled = None
+
+
+def _apply(method, *args):
+    """ Правит индекс процесса и передаёт изменение остальным """
+    global _version
+    version = bump_tag(AUTOCOMPLETE_TAG)
+    cache.set(_change_key(version), (method, args), CHANGE_TIMEOUT)
+    with _lock:
+        if _index is None:
+            return
+        getattr(_index, method)(*args)
+        # если других изменений между ними не было, индекс актуален;
+        # иначе это изменение применится ещё раз по порядку
+        if _version == version - 1:
+            _version = version
+
+
+def _on_commit(method, *args):
+    # откаченная транзакция не должна оставить следов в индексе
+    transaction.on_commit(partial(_apply, method, *args))
+
+
+def user_changed(user):
+    if user.is_active:
+        _on_commit('add', USER, user.pk, *user_entry(user))
+    else:
+        user_removed(user)
+
+
+def user_removed(user):
+    _on_commit('remove', USER, user.pk)
+
+
+def group_changed(group):
+    _on_commit('add', GROUP, group.pk, *group_entry(group))
+
+
+def group_removed(group):
+    _on_commit('remove', GROUP, group.pk)
+
+
+def suggest(prefix, kind=None, limit=LIMIT):
+    """ Подсказки ``[(вид, данные)]`` по началу имени или названия """
+    return get_index().search(prefix, kind, min(limit, MAX_LIMIT))
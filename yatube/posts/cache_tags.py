@@ -0,0 +1,62 @@
+""" Теги кеша для страниц и фрагментов с постами.
+
+Записи кеша помечаются тегами, а сигналы моделей сбрасывают теги при
+изменении постов, комментариев, групп и подписок.
+"""
+from core.cache import record_shown, tag_versions
+
+INDEX_TAG = 'feed:index'
+
+
+def group_tag(slug):
+    return f'group:{slug}'
+
+
+def author_tag(username):
+    return f'author:{username}'
+
+
+def post_tag(post_id):
+    return f'post:{post_id}'
+
+
+def card_tag(post_id):
+    return f'card:{post_id}'
+
+
+def user_tag(user_id):
+    return f'user:{user_id}'
+
+
+def index_tags(request):
+    return [INDEX_TAG]
+
+
+def group_tags(request, slug):
+    return [group_tag(slug)]
+
+
+def profile_tags(request, username):
+    return [author_tag(username)]
+
+
+def with_card_versions(posts, request=None):
+    """ Проставляет постам версию карточки одним обращением к кешу.
+
+    Версия меняется при правке поста или данных его автора и входит в
+    ключ кешированной разметки карточки. С ``request`` версии карточек
+    входят и в версию кешированной страницы ленты.
+    """
+    posts = list(posts)
+    card_tags = {
+        post.pk: (card_tag(post.pk), user_tag(post.author_id))
+        for post in posts
+    }
+    versions = tag_versions(
+        {tag for tags in card_tags.values() for tag in tags})
+    if request is not None:
+        record_shown(request, versions)
+    for post in posts:
+        post.card_version = '.'.join(
+            str(versions[tag]) for tag in card_tags[post.pk])
+    return posts
@@ -0,0 +1,127 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import AuthorStats, Comment, Follow, Group, Post, User
+
+
+def count_of(model, field):
+    """ Подзапрос: число строк ``model``, ссылающихся на текущую запись """
+    rows = (model.objects.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total'))
+    return Coalesce(Subquery(rows), 0)
+
+
+def shifted(field, delta):
+    """ Новое значение счётчика; уменьшение не уходит ниже нуля.
+
+    Счётчики могут разойтись с таблицами (bulk_create не шлёт сигналов),
+    а отрицательное значение нарушило бы CHECK беззнакового поля.
+    """
+    if delta < 0:
+        return Greatest(F(field) + delta, 0)
+    return F(field) + delta
+
+
+def _author_values(user_id):
+    """ Точные значения счётчиков пользователя, посчитанные по таблицам """
+    return {
+        'posts_count': Post.objects.filter(author_id=user_id).count(),
+        'followers_count': Follow.objects.filter(author_id=user_id).count(),
+        'following_count': Follow.objects.filter(user_id=user_id).count(),
+    }
+
+
+def bump_author(user_id, field, delta):
+    """ Сдвигает счётчик пользователя на ``delta`` одним UPDATE.
+
+    Если строки счётчиков ещё нет, она создаётся с точными значениями,
+    которые уже учитывают только что сохранённую запись.
+    """
+    if user_id is None:
+        return
+    updated = AuthorStats.objects.filter(user_id=user_id).update(
+        **{field: shifted(field, delta)})
+    if not updated and delta > 0:
+        with transaction.atomic():
+            AuthorStats.objects.get_or_create(
+                user_id=user_id, defaults=_author_values(user_id))
+
+
+def bump_group(group_id, delta):
+    if group_id is not None:
+        Group.objects.filter(pk=group_id).update(
+            posts_count=shifted('posts_count', delta))
+
+
+def bump_comments(post_id, delta):
+    if post_id is not None:
+        Post.objects.filter(pk=post_id).update(
+            comments_count=shifted('comments_count', delta))
+
+
+def stats_for(user):
+    """ Счётчики пользователя; недостающая строка создаётся по таблицам """
+    try:
+        return user.stats
+    except AuthorStats.DoesNotExist:
+        stats, _ = AuthorStats.objects.get_or_create(
+            user_id=user.pk, defaults=_author_values(user.pk))
+        return stats
+
+
+def _pk_batches(queryset, batch_size):
+    """ Первичные ключи выборки пачками по возрастанию """
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')
+                     .values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1]
+
+
+def recount_users(user_ids):
+    """ Пересчитывает счётчики перечисленных пользователей по таблицам """
+    AuthorStats.objects.bulk_create(
+        [AuthorStats(user_id=pk) for pk in user_ids],
+        ignore_conflicts=True,
+    )
+    return AuthorStats.objects.filter(user_id__in=user_ids).update(
+        posts_count=count_of(Post, 'author'),
+        followers_count=count_of(Follow, 'author'),
+        following_count=count_of(Follow, 'user'),
+    )
+
+
+def recount_authors(batch_size):
+    """ Пересчитывает счётчики пользователей, возвращает число строк """
+    total = 0
+    for batch in _pk_batches(User.objects.all(), batch_size):
+        with transaction.atomic():
+            total += recount_users(batch)
+    return total
+
+
+def recount_posts(batch_size):
+    """ Пересчитывает число комментариев у постов """
+    total = 0
+    for batch in _pk_batches(Post.objects.all(), batch_size):
+        with transaction.atomic():
+            total += Post.objects.filter(pk__in=batch).update(
+                comments_count=count_of(Comment, 'post'))
+    return total
+
+
+def recount_groups(batch_size):
+    """ Пересчитывает число постов в группах """
+    total = 0
+    for batch in _pk_batches(Group.objects.all(), batch_size):
+        with transaction.atomic():
+            total += Group.objects.filter(pk__in=batch).update(
+                posts_count=count_of(Post, 'group'))
+    return total
@@ -0,0 +1,216 @@
+import heapq
+from collections import defaultdict
+from itertools import islice
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+from .models import AuthorStats, FeedEntry, Follow, Post
+from .paginator import CursorPaginator, keyset_window
+
+# ключ курсора для строк ленты: они сортируются по копии даты поста
+FEED_KEYS = ('pub_date', 'post_id')
+POST_KEYS = ('pub_date', 'pk')
+
+_post_key = attrgetter('pub_date', 'pk')
+
+
+def _insert_entries(entries):
+    """ Вставляет строки ленты пачками, пропуская уже существующие """
+    entries = iter(entries)
+    while True:
+        batch = list(islice(entries, settings.FEED_BATCH_SIZE))
+        if not batch:
+            break
+        FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def is_pulled(author_id):
+    """ Посты автора с множеством подписчиков читаются при показе ленты """
+    return AuthorStats.objects.filter(user_id=author_id, pulled=True).exists()
+
+
+def pulled_authors(user):
+    """ id популярных авторов из подписок пользователя """
+    return list(
+        Follow.objects.filter(user=user, author__stats__pulled=True)
+        .values_list('author_id', flat=True)
+    )
+
+
+def mark_pulled(author_ids=None):
+    """ Переводит в pull авторов, набравших FEED_PULL_THRESHOLD подписчиков.
+
+    Переключение дешёвое: строки ленты остаются, а лента перестаёт их
+    читать. Без ``author_ids`` проверяются все авторы.
+    """
+    stats = AuthorStats.objects.filter(
+        pulled=False,
+        followers_count__gte=settings.FEED_PULL_THRESHOLD,
+    )
+    if author_ids is not None:
+        stats = stats.filter(user_id__in=list(author_ids))
+    return stats.update(pulled=True)
+
+
+def fan_out(post):
+    """ Раздаёт новый пост в ленты всех подписчиков автора """
+    if post.author_id is None or is_pulled(post.author_id):
+        return
+    followers = (Follow.objects.filter(author_id=post.author_id)
+                 .values_list('user_id', flat=True)
+                 .iterator())
+    _insert_entries(
+        FeedEntry(user_id=user_id, post_id=post.pk,
+                  author_id=post.author_id, pub_date=post.pub_date)
+        for user_id in followers
+    )
+
+
+def backfill(user_id, author_id):
+    """ Добавляет в ленту подписчика уже опубликованные посты автора """
+    if is_pulled(author_id):
+        return
+    posts = (Post.objects.filter(author_id=author_id)
+             .values_list('pk', 'pub_date')
+             .iterator())
+    _insert_entries(
+        FeedEntry(user_id=user_id, post_id=post_id,
+                  author_id=author_id, pub_date=pub_date)
+        for post_id, pub_date in posts
+    )
+
+
+def backfill_many(pairs):
+    """ backfill для пачки подписок: посты каждого автора читаются один раз """
+    followers = defaultdict(list)
+    for user_id, author_id in pairs:
+        followers[author_id].append(user_id)
+    pulled = set(AuthorStats.objects.filter(
+        user_id__in=list(followers), pulled=True,
+    ).values_list('user_id', flat=True))
+    for author_id, user_ids in followers.items():
+        if author_id in pulled:
+            continue
+        posts = list(Post.objects.filter(author_id=author_id)
+                     .values_list('pk', 'pub_date'))
+        _insert_entries(
+            FeedEntry(user_id=user_id, post_id=post_id,
+                      author_id=author_id, pub_date=pub_date)
+            for user_id in user_ids
+            for post_id, pub_date in posts
+        )
+
+
+def _push(author_id, followers, posts):
+    """ Раскладывает посты ``posts`` автора по лентам ``followers`` """
+    posts = list(posts.values_list('pk', 'pub_date'))
+    if not posts:
+        return
+    followers = followers.values_list('user_id', flat=True).iterator()
+    _insert_entries(
+        FeedEntry(user_id=user_id, post_id=post_id,
+                  author_id=author_id, pub_date=pub_date)
+        for user_id in followers
+        for post_id, pub_date in posts
+    )
+
+
+def push_candidates():
+    """ id авторов в pull, у которых подписчиков меньше FEED_PUSH_THRESHOLD """
+    return list(AuthorStats.objects.filter(
+        pulled=True,
+        followers_count__lt=settings.FEED_PUSH_THRESHOLD,
+    ).values_list('user_id', flat=True))
+
+
+def repush(author_id):
+    """ Возвращает автора из pull в push; True, если он переключён.
+
+    Пока посты раскладываются по лентам, автор остаётся в pull и лента
+    читает его посты из профиля. Подписки и посты, появившиеся за это
+    время, раскладываются после переключения: их сигналы ещё видели
+    автора в pull и ничего не вставили.
+    """
+    follows = Follow.objects.filter(author_id=author_id)
+    posts = Post.objects.filter(author_id=author_id)
+    last_follow = follows.aggregate(last=Max('pk'))['last'] or 0
+    last_post = posts.aggregate(last=Max('pk'))['last'] or 0
+    _push(author_id, follows.filter(pk__lte=last_follow),
+          posts.filter(pk__lte=last_post))
+    with transaction.atomic():
+        switched = AuthorStats.objects.filter(
+            user_id=author_id, pulled=True,
+            followers_count__lt=settings.FEED_PUSH_THRESHOLD,
+        ).update(pulled=False)
+    if not switched:
+        # автор снова набрал подписчиков: строки ленты не помешают
+        return False
+    _push(author_id, follows.filter(pk__gt=last_follow), posts)
+    _push(author_id, follows.filter(pk__lte=last_follow),
+          posts.filter(pk__gt=last_post))
+    return True
+
+
+def prune(user_id, author_id):
+    """ Убирает из ленты подписчика посты автора после отписки.
+
+    Автор, переставший быть популярным, остаётся в pull: раскладывать
+    его посты по лентам всех подписчиков в запросе отписки слишком
+    дорого, это делает команда push_feeds.
+    """
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+class FollowFeed:
+    """ Лента подписок пользователя.
+
+    Посты обычных авторов заранее разложены по FeedEntry (push), посты
+    популярных авторов читаются из их профилей при показе (pull). Все
+    источники сливаются по (pub_date, id) k-way слиянием.
+    """
+    ordered = True
+
+    def __init__(self, user):
+        pulled = pulled_authors(user)
+        # строки популярных авторов, оставшиеся с времён push, не нужны:
+        # их посты и так придут из pull-источника
+        self.pushed = (FeedEntry.objects.filter(user=user)
+                       .exclude(author_id__in=pulled)
+                       .select_related('post__author', 'post__group'))
+        self.pulled = [Post.objects.filter(author_id=author_id)
+                       .select_related('author', 'group')
+                       for author_id in pulled]
+
+    def count(self):
+        return self.pushed.count() + sum(
+            source.count() for source in self.pulled)
+
+    def window(self, cursor, backwards, limit):
+        """ Слитое окно из всех источников по одну сторону от курсора """
+        streams = [[entry.post for entry in keyset_window(
+            self.pushed, FEED_KEYS, cursor, backwards, limit)]]
+        streams.extend(
+            keyset_window(source, POST_KEYS, cursor, backwards, limit)
+            for source in self.pulled
+        )
+        rows = list(heapq.merge(*streams, key=_post_key, reverse=True))
+        # назад берём ближайшие к курсору записи, то есть самые старые
+        return rows[-limit:] if backwards else rows[:limit]
+
+    def __getitem__(self, item):
+        # нумерованная страница: из каждого источника хватит первых stop
+        stop = item.stop
+        streams = [[entry.post for entry in self.pushed[:stop]]]
+        streams.extend(list(source[:stop]) for source in self.pulled)
+        rows = list(heapq.merge(*streams, key=_post_key, reverse=True))
+        return rows[item]
+
+
+class FollowFeedPaginator(CursorPaginator):
+    """ Курсорный паджинатор для слитой ленты подписок """
+
+    def _window(self, cursor, backwards, limit):
+        return self.object_list.window(cursor, backwards, limit)
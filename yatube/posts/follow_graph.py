@@ -0,0 +1,117 @@
+""" Граф подписок в кеше.
+
+Для каждого пользователя хранятся два отсортированных массива ``array('i')``:
+на кого он подписан и кто подписан на него, по 4 байта на id. Массив
+читается из базы при первом обращении и кладётся в общий кеш под ключом с
+версией тега; сигналы подписок после коммита сбрасывают теги обоих
+участников. Проверка подписки — двоичный поиск в массиве.
+"""
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core.cache import bump_tags, tag_versions
+
+from .models import Follow
+
+FOLLOWING = 'following'
+FOLLOWERS = 'followers'
+# по какому полю Follow искать и какое брать: (условие, значение)
+FIELDS = {
+    FOLLOWING: ('user_id', 'author_id'),
+    FOLLOWERS: ('author_id', 'user_id'),
+}
+
+
+def _tag(direction, user_id):
+    return f'graph:{direction}:{user_id}'
+
+
+def _load(direction, user_id):
+    where, value = FIELDS[direction]
+    return array('i', Follow.objects.filter(**{where: user_id})
+                 .order_by(value).values_list(value, flat=True))
+
+
+def _ids(direction, user_id):
+    """ Отсортированный массив id соседей пользователя """
+    if user_id is None:
+        return array('i')
+    tag = _tag(direction, user_id)
+    version = tag_versions([tag])[tag]
+    key = f'{tag}:{version}'
+    raw = cache.get(key)
+    if raw is not None:
+        ids = array('i')
+        ids.frombytes(raw)
+        return ids
+    ids = _load(direction, user_id)
+    cache.set(key, ids.tobytes(), settings.FOLLOW_GRAPH_TIMEOUT)
+    return ids
+
+
+def following_ids(user_id):
+    """ id авторов, на которых подписан пользователь, по возрастанию """
+    return _ids(FOLLOWING, user_id)
+
+
+def follower_ids(user_id):
+    """ id подписчиков пользователя, по возрастанию """
+    return _ids(FOLLOWERS, user_id)
+
+
+def _contains(ids, value):
+    position = bisect_left(ids, value)
+    return position < len(ids) and ids[position] == value
+
+
+def is_following(user_id, author_id):
+    """ Подписан ли пользователь на автора """
+    if user_id is None or author_id is None:
+        return False
+    return _contains(following_ids(user_id), author_id)
+
+
+def is_mutual(user_id, other_id):
+    """ Подписаны ли пользователи друг на друга """
+    return (is_following(user_id, other_id)
+            and is_following(other_id, user_id))
+
+
+def mutual_ids(user_id):
+    """ id пользователей с взаимной подпиской: слияние двух массивов """
+    following = following_ids(user_id)
+    followers = follower_ids(user_id)
+    mutual = array('i')
+    i = j = 0
+    while i < len(following) and j < len(followers):
+        if following[i] == followers[j]:
+            mutual.append(following[i])
+            i += 1
+            j += 1
+        elif following[i] < followers[j]:
+            i += 1
+        else:
+            j += 1
+    return mutual
+
+
+def changed(follow):
+    """ Сбрасывает массивы обоих участников подписки """
+    changed_many([(follow.user_id, follow.author_id)])
+
+
+def changed_many(pairs):
+    """ Сбрасывает массивы участников подписок ``(user_id, author_id)``.
+
+    Второй сброс после коммита нужен, если между первым сбросом и коммитом
+    другой запрос успел прочитать из базы прежний список.
+    """
+    tags = set()
+    for user_id, author_id in pairs:
+        tags.update((_tag(FOLLOWING, user_id), _tag(FOLLOWERS, author_id)))
+    bump_tags(*tags)
+    transaction.on_commit(lambda: bump_tags(*tags))
@@ -0,0 +1,213 @@
+""" Подписка и отписка одним SQL-запросом, импорт и экспорт подписок.
+
+Проверка «есть ли уже подписка» и запись в одном операторе: INSERT ... ON
+CONFLICT DO NOTHING и DELETE сообщают через RETURNING, изменили ли они
+строку, а на SQLite старше 3.35 — через rowcount у INSERT OR IGNORE и
+DELETE по id. Поэтому при одновременных нажатиях «Подписаться»/«Отписаться»
+дубли не появляются, а сигналы со счётчиками и лентой срабатывают ровно
+один раз на каждое настоящее изменение.
+
+Импорт пачками вставляет подписки через bulk_create, пропуская уже
+существующие, и за пачку делает то же, что сигналы делают за одну
+подписку: пересчитывает счётчики, дополняет ленты и сбрасывает кеш.
+"""
+import csv
+import json
+from collections import Counter
+from itertools import islice
+
+from django.db import connection, transaction
+from django.db.backends.sqlite3.base import Database
+from django.db.models.signals import post_delete, post_save
+
+from core.cache import bump_tags
+
+from . import counters, feed, follow_graph
+from .cache_tags import author_tag
+from .models import Follow, User
+
+# поля ребра графа подписок во входных и выходных файлах
+FIELDS = ('user', 'author')
+
+TABLE = connection.ops.quote_name(Follow._meta.db_table)
+# RETURNING есть в SQLite начиная с 3.35; на более старых изменённая
+# строка определяется по rowcount
+HAS_RETURNING = Database.sqlite_version_info >= (3, 35, 0)
+FOLLOW_SQL = (
+    f'INSERT INTO {TABLE} (user_id, author_id) VALUES (%s, %s) '
+    'ON CONFLICT (user_id, author_id) DO NOTHING RETURNING id'
+)
+UNFOLLOW_SQL = (
+    f'DELETE FROM {TABLE} WHERE user_id = %s AND author_id = %s '
+    'RETURNING id'
+)
+FOLLOW_OR_IGNORE_SQL = (
+    f'INSERT OR IGNORE INTO {TABLE} (user_id, author_id) VALUES (%s, %s)'
+)
+UNFOLLOW_BY_ID_SQL = f'DELETE FROM {TABLE} WHERE id = %s'
+
+
+def _insert(user, author):
+    """ id созданной подписки; пустой список, если она уже была """
+    with connection.cursor() as cursor:
+        if HAS_RETURNING:
+            cursor.execute(FOLLOW_SQL, (user.pk, author.pk))
+            return [pk for pk, in cursor.fetchall()]
+        cursor.execute(FOLLOW_OR_IGNORE_SQL, (user.pk, author.pk))
+        return [cursor.lastrowid] if cursor.rowcount == 1 else []
+
+
+def _delete(user, author):
+    """ id удалённой подписки; пустой список, если её не было """
+    with connection.cursor() as cursor:
+        if HAS_RETURNING:
+            cursor.execute(UNFOLLOW_SQL, (user.pk, author.pk))
+            return [pk for pk, in cursor.fetchall()]
+        deleted = []
+        # строку мог удалить параллельный запрос: её удалил тот, у кого
+        # DELETE затронул строку
+        for pk in (Follow.objects.filter(user=user, author=author)
+                   .values_list('pk', flat=True)):
+            cursor.execute(UNFOLLOW_BY_ID_SQL, (pk,))
+            if cursor.rowcount == 1:
+                deleted.append(pk)
+        return deleted
+
+
+def follow(user, author):
+    """ Подписывает пользователя на автора; True, если подписки не было """
+    with transaction.atomic():
+        created = _insert(user, author)
+        for pk in created:
+            post_save.send(
+                sender=Follow,
+                instance=Follow(pk=pk, user=user, author=author),
+                created=True, update_fields=None, raw=False,
+                using=connection.alias,
+            )
+    return bool(created)
+
+
+def unfollow(user, author):
+    """ Отписывает пользователя от автора; True, если подписка была """
+    with transaction.atomic():
+        deleted = _delete(user, author)
+        for pk in deleted:
+            post_delete.send(
+                sender=Follow,
+                instance=Follow(pk=pk, user=user, author=author),
+                using=connection.alias,
+            )
+    return bool(deleted)
+
+
+def read_csv(lines):
+    """ Рёбра (подписчик, автор) из CSV с заголовком user,author """
+    rows = csv.DictReader(lines)
+    try:
+        for row in rows:
+            yield row.get('user'), row.get('author')
+    except csv.Error as error:
+        raise ValueError(f'Строка {rows.line_num}: {error}')
+
+
+def read_ndjson(lines):
+    """ Рёбра из строк вида {"user": "...", "author": "..."} """
+    for line in lines:
+        if line.strip():
+            row = json.loads(line)
+            if not isinstance(row, dict):
+                raise ValueError(f'Ожидался объект JSON: {line.strip()}')
+            edge = row.get('user'), row.get('author')
+            # имена — строки; пустой подписчик заполняется при импорте
+            if not all(name is None or isinstance(name, str)
+                       for name in edge):
+                raise ValueError(f'Имена должны быть строками: '
+                                 f'{line.strip()}')
+            yield edge
+
+
+READERS = {'csv': read_csv, 'ndjson': read_ndjson}
+
+
+def _import_batch(batch, stats):
+    names = {name for edge in batch for name in edge if name}
+    ids = dict(User.objects.filter(username__in=names)
+               .values_list('username', 'pk'))
+    pairs = {(ids[user], ids[author]) for user, author in batch
+             if user in ids and author in ids and user != author}
+    if not pairs:
+        stats['skipped'] += len(batch)
+        return
+    users = sorted({user_id for user_id, _ in pairs})
+    with transaction.atomic():
+        before = Follow.objects.filter(user_id__in=users).count()
+        Follow.objects.bulk_create(
+            [Follow(user_id=user_id, author_id=author_id)
+             for user_id, author_id in pairs],
+            ignore_conflicts=True,
+        )
+        created = Follow.objects.filter(user_id__in=users).count() - before
+        # сигналы bulk_create не отправляет: их работа — за всю пачку
+        counters.recount_users(sorted({pk for pair in pairs for pk in pair}))
+        feed.mark_pulled({author_id for _, author_id in pairs})
+        feed.backfill_many(pairs)
+        follow_graph.changed_many(pairs)
+        bump_tags(*(author_tag(name) for name in names if name in ids))
+    stats['created'] += created
+    stats['skipped'] += len(batch) - created
+
+
+def import_follows(edges, batch_size, owner=None):
+    """ Создаёт подписки из рёбер (подписчик, автор), заданных именами.
+
+    Неизвестные пользователи, подписки на себя и уже существующие
+    подписки пропускаются. С ``owner`` можно подписывать только его
+    самого: пустой подписчик означает ``owner``, чужие рёбра не
+    импортируются. Возвращает счётчики read, created, skipped, forbidden.
+    """
+    stats = Counter(read=0, created=0, skipped=0, forbidden=0)
+    edges = iter(edges)
+    while True:
+        chunk = list(islice(edges, batch_size))
+        if not chunk:
+            return stats
+        stats['read'] += len(chunk)
+        batch = []
+        for user, author in chunk:
+            if owner is not None:
+                user = user or owner.username
+                if user != owner.username:
+                    stats['forbidden'] += 1
+                    continue
+            batch.append((user, author))
+        _import_batch(batch, stats)
+
+
+def export_rows(batch_size):
+    """ Все подписки как пары имён; читаются пачками по первичному ключу """
+    last_pk = 0
+    while True:
+        rows = list(Follow.objects.filter(pk__gt=last_pk).order_by('pk')
+                    .values_list('pk', 'user__username', 'author__username')
+                    [:batch_size])
+        if not rows:
+            return
+        for _, user, author in rows:
+            yield user, author
+        last_pk = rows[-1][0]
+
+
+def write_csv(rows, output):
+    writer = csv.writer(output, lineterminator='\n')
+    writer.writerow(FIELDS)
+    writer.writerows(rows)
+
+
+def write_ndjson(rows, output):
+    for row in rows:
+        output.write(json.dumps(dict(zip(FIELDS, row)),
+                                ensure_ascii=False) + '\n')
+
+
+WRITERS = {'csv': write_csv, 'ndjson': write_ndjson}
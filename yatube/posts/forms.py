@@ -1,5 +1,7 @@
+from django.core.files.uploadedfile import UploadedFile
 from django.forms import ModelForm
 
+from .images import ingest_image
 from .models import Post, Comment
 
 
@@ -13,6 +15,13 @@ class PostForm(ModelForm):
             'image': 'Картинка поста',
         }
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        # уже сохранённую картинку при правке поста не трогаем
+        if isinstance(image, UploadedFile):
+            image = ingest_image(image)
+        return image
+
 
 class CommentForm(ModelForm):
     class Meta:
@@ -0,0 +1,144 @@
+""" Приём картинок постов.
+
+Перед сохранением картинка уменьшается до ``IMAGE_MAX_SIDE`` по большей
+стороне, поворачивается по EXIF и пересохраняется без метаданных. JPEG
+декодируется сразу в уменьшенном масштабе (``draft``), а картинки больше
+``IMAGE_MAX_PIXELS`` пикселей или с числом кадров больше
+``IMAGE_MAX_FRAMES`` отклоняются до декодирования, поэтому память на
+одну загрузку ограничена. Анимации пересобираются по кадрам с прежними
+задержками, тоже без метаданных; MPO с камер — это JPEG с лишними
+кадрами, от него остаётся первый.
+"""
+import io
+import os
+import warnings
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps, ImageSequence
+
+# форматы, в которых картинка хранится как есть; остальные — в PNG
+KEPT_FORMATS = {
+    'JPEG': ('.jpg', 'image/jpeg'),
+    'PNG': ('.png', 'image/png'),
+    'GIF': ('.gif', 'image/gif'),
+    'WEBP': ('.webp', 'image/webp'),
+}
+# форматы, в которых хранятся анимации
+ANIMATED_FORMATS = {'GIF', 'PNG', 'WEBP'}
+# что переносится из info: writer'ы PNG и GIF берут оттуда EXIF, ICC и
+# комментарий, поэтому остальное отбрасывается
+KEPT_INFO = {'transparency', 'background'}
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 85, 'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': 85},
+}
+
+
+def _open(upload):
+    upload.seek(0)
+    try:
+        with warnings.catch_warnings():
+            # предупреждение Pillow о «бомбе» считаем ошибкой
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            image = Image.open(upload)
+    except (Image.DecompressionBombWarning, Image.DecompressionBombError):
+        raise ValidationError('Картинка слишком большая.')
+    width, height = image.size
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Картинка слишком большая: не больше %(pixels)s пикселей.',
+            params={'pixels': settings.IMAGE_MAX_PIXELS},
+        )
+    return image
+
+
+def _output_format(image):
+    if image.format == 'MPO':
+        return 'JPEG'
+    if image.format in KEPT_FORMATS and image.format in Image.SAVE:
+        return image.format
+    return 'PNG'
+
+
+def _upload(name, content, format_):
+    extension, content_type = KEPT_FORMATS[format_]
+    name = os.path.splitext(os.path.basename(name))[0] + extension
+    return SimpleUploadedFile(name, content, content_type)
+
+
+def _without_metadata(image):
+    image.info = {key: value for key, value in image.info.items()
+                  if key in KEPT_INFO}
+    return image
+
+
+def _ingest_animation(upload, image):
+    if image.n_frames > settings.IMAGE_MAX_FRAMES:
+        raise ValidationError(
+            'В анимации не больше %(frames)s кадров.',
+            params={'frames': settings.IMAGE_MAX_FRAMES},
+        )
+    if max(image.size) > settings.IMAGE_MAX_SIDE:
+        raise ValidationError(
+            'Анимация не больше %(side)s пикселей по стороне.',
+            params={'side': settings.IMAGE_MAX_SIDE},
+        )
+    width, height = image.size
+    # все кадры декодируются разом: ограничиваем их общий размер
+    if width * height * image.n_frames > settings.IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Анимация слишком большая: не больше %(pixels)s пикселей '
+            'во всех кадрах.',
+            params={'pixels': settings.IMAGE_MAX_PIXELS},
+        )
+    # WebP без поддержки записи в Pillow пересобирается в APNG
+    format_ = _output_format(image)
+    frames = []
+    durations = []
+    for frame in ImageSequence.Iterator(image):
+        durations.append(frame.info.get('duration', 0))
+        frames.append(_without_metadata(frame.copy()))
+    output = io.BytesIO()
+    # комментарии, EXIF, XMP и ICC не сохраняются, а задержки и число
+    # повторов передаются явно
+    frames[0].save(
+        output, format_, save_all=True, append_images=frames[1:],
+        duration=durations, loop=image.info.get('loop', 0),
+        **SAVE_OPTIONS.get(format_, {}),
+    )
+    image.close()
+    return _upload(upload.name, output.getvalue(), format_)
+
+
+def _ingest_still(upload, image):
+    format_ = _output_format(image)
+    max_side = settings.IMAGE_MAX_SIDE
+    # JPEG декодируется сразу с уменьшением в 2, 4 или 8 раз
+    image.draft(None, (max_side, max_side))
+    image = ImageOps.exif_transpose(image)
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS,
+                        reducing_gap=2.0)
+    if format_ == 'JPEG' and image.mode not in ('RGB', 'L', 'CMYK'):
+        image = image.convert('RGB')
+    output = io.BytesIO()
+    _without_metadata(image).save(output, format_,
+                                  **SAVE_OPTIONS.get(format_, {}))
+    image.close()
+    return _upload(upload.name, output.getvalue(), format_)
+
+
+def ingest_image(upload):
+    """ Уменьшенная картинка без метаданных для сохранения в пост """
+    image = _open(upload)
+    try:
+        if (image.format in ANIMATED_FORMATS
+                and getattr(image, 'n_frames', 1) > 1):
+            return _ingest_animation(upload, image)
+        return _ingest_still(upload, image)
+    except (OSError, Image.DecompressionBombError):
+        # заголовок прочитался, а данные битые или обрезаны
+        raise ValidationError('Не удалось прочитать картинку.')
@@ -0,0 +1,107 @@
+""" Хранилище метаданных миниатюр sorl-thumbnail с локальным LRU.
+
+Перед общим кешем и таблицей sorl стоит небольшой словарь в памяти
+процесса, а ``get_many_raw`` достаёт записи для всей страницы разом:
+сначала из LRU, затем одним ``get_many`` из кеша и одним запросом из БД.
+Записи живут в LRU не дольше ``THUMBNAIL_LRU_TIMEOUT`` секунд: миниатюры,
+удалённые другим процессом, перестают показываться и строятся заново.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+
+class LRUKVStore(KVStore):
+    """ cached_db KVStore sorl с LRU-кешем найденных записей в процессе.
+
+    В LRU попадают только найденные записи: миниатюру, которой ещё нет,
+    может в любой момент построить другой процесс.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, key, value):
+        expires = time.monotonic() + settings.THUMBNAIL_LRU_TIMEOUT
+        with self._lock:
+            self._lru[key] = (value, expires)
+            self._lru.move_to_end(key)
+            while len(self._lru) > settings.THUMBNAIL_LRU_SIZE:
+                self._lru.popitem(last=False)
+
+    def _recall(self, key):
+        with self._lock:
+            value, expires = self._lru.get(key, (None, None))
+            if value is None:
+                return None
+            if expires <= time.monotonic():
+                # запись могли удалить в другом процессе: читаем заново
+                del self._lru[key]
+                return None
+            self._lru.move_to_end(key)
+            return value
+
+    def _forget(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._lru.pop(key, None)
+
+    def _get_raw(self, key):
+        value = self._recall(key)
+        if value is None:
+            value = super()._get_raw(key)
+            if value is not None:
+                self._remember(key, value)
+        return value
+
+    def _set_raw(self, key, value):
+        super()._set_raw(key, value)
+        self._remember(key, value)
+
+    def _delete_raw(self, *keys):
+        super()._delete_raw(*keys)
+        self._forget(*keys)
+
+    def clear(self, delete_thumbnails=False):
+        super().clear(delete_thumbnails)
+        self.forget_all()
+
+    def forget_all(self):
+        """ Очищает LRU процесса, не трогая кеш и БД """
+        with self._lock:
+            self._lru.clear()
+
+    def get_many_raw(self, keys):
+        """ Значения ключей разом: LRU, затем кеш, затем один запрос в БД """
+        found = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            value = self._recall(key)
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+        if not missing:
+            return found
+        cached = self.cache.get_many(missing)
+        missing = [key for key in missing if key not in cached]
+        if missing:
+            stored = dict(KVStoreModel.objects.filter(key__in=missing)
+                          .values_list('key', 'value'))
+            # как и в KVStore, отсутствие записи тоже кешируется
+            fetched = {key: stored.get(key, EMPTY_VALUE) for key in missing}
+            self.cache.set_many(fetched, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+            cached.update(fetched)
+        for key, value in cached.items():
+            if value != EMPTY_VALUE:
+                found[key] = value
+                self._remember(key, value)
+        return found
@@ -0,0 +1,44 @@
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts import storage
+
+
+class Command(BaseCommand):
+    help = ('Переносит картинки постов под имена по хешу содержимого, '
+            'объединяя одинаковые файлы, и удаляет ставшие ненужными копии')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько постов читать из базы за один запрос',
+        )
+
+    def handle(self, *args, **options):
+        posts = (Post.objects.exclude(image='').exclude(image=None)
+                 .values_list('pk', 'image'))
+        moved = missing = 0
+        old_names = set()
+        for post_id, name in posts.iterator(chunk_size=options['batch_size']):
+            if storage.is_content_name(name):
+                continue
+            try:
+                exists = storage.content_storage.exists(name)
+            except SuspiciousFileOperation:
+                # путь вне MEDIA_ROOT
+                exists = False
+            if not exists:
+                missing += 1
+                continue
+            new_name = storage.rehash(name)
+            Post.objects.filter(pk=post_id).update(image=new_name)
+            old_names.add(name)
+            moved += 1
+        deleted = sum(storage.delete_if_unused(name) for name in old_names)
+        self.stdout.write(
+            f'Перенесено картинок: {moved}, удалено копий: {deleted}, '
+            f'файлов не найдено: {missing}'
+        )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from posts import follows
+
+
+class Command(BaseCommand):
+    help = ('Выводит все подписки в CSV (user,author) или NDJSON, читая '
+            'их из базы пачками')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format',
+            choices=sorted(follows.WRITERS),
+            default='csv',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько подписок читать из базы за один запрос',
+        )
+
+    def handle(self, *args, **options):
+        write = follows.WRITERS[options['format']]
+        write(follows.export_rows(options['batch_size']), self.stdout)
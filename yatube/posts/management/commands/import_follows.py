@@ -0,0 +1,47 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import follows
+
+
+class Command(BaseCommand):
+    help = ('Создаёт подписки из файла CSV (user,author) или NDJSON, '
+            'пропуская уже существующие')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл с подписками или - для stdin')
+        parser.add_argument(
+            '--format',
+            choices=sorted(follows.READERS),
+            help='Формат файла; по умолчанию — по расширению',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько подписок вставлять в одной транзакции',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format_ = options['format']
+        if format_ is None:
+            extension = os.path.splitext(path)[1].lstrip('.').lower()
+            format_ = 'ndjson' if extension in ('ndjson', 'jsonl') else 'csv'
+        read = follows.READERS[format_]
+        try:
+            if path == '-':
+                stats = follows.import_follows(read(sys.stdin),
+                                               options['batch_size'])
+            else:
+                with open(path, encoding='utf-8', newline='') as file:
+                    stats = follows.import_follows(read(file),
+                                                   options['batch_size'])
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+        self.stdout.write(
+            f"Прочитано: {stats['read']}, создано подписок: "
+            f"{stats['created']}, пропущено: {stats['skipped']}"
+        )
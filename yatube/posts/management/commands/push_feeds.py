@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts import feed
+
+
+class Command(BaseCommand):
+    help = ('Раскладывает по лентам подписчиков посты авторов, у которых '
+            'подписчиков стало меньше FEED_PUSH_THRESHOLD')
+
+    def handle(self, *args, **options):
+        total = 0
+        for author_id in feed.push_candidates():
+            total += feed.repush(author_id)
+        self.stdout.write(f'Возвращено в ленты авторов: {total}')
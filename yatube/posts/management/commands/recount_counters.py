@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters, feed
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает денормализованные счётчики постов, комментариев '
+            'и подписок, исправляя расхождения с таблицами')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько строк пересчитывать в одной транзакции',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        recounts = (
+            ('пользователей', counters.recount_authors),
+            ('постов', counters.recount_posts),
+            ('групп', counters.recount_groups),
+        )
+        for title, recount in recounts:
+            total = recount(batch_size)
+            self.stdout.write(f'Пересчитано {title}: {total}')
+        # исправленные счётчики могли перейти порог pull
+        total = feed.mark_pulled()
+        self.stdout.write(f'Переведено в pull авторов: {total}')
@@ -0,0 +1,43 @@
+from django.db import migrations
+
+# индекс хранит только слова, текст берётся из posts_post по rowid = id
+CREATE_INDEX = """
+CREATE VIRTUAL TABLE posts_post_fts USING fts5(
+    text,
+    content='posts_post',
+    content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER posts_post_fts_insert AFTER INSERT ON posts_post BEGIN
+    INSERT INTO posts_post_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER posts_post_fts_delete AFTER DELETE ON posts_post BEGIN
+    INSERT INTO posts_post_fts (posts_post_fts, rowid, text)
+    VALUES ('delete', old.id, old.text);
+END;
+CREATE TRIGGER posts_post_fts_update AFTER UPDATE OF text ON posts_post
+BEGIN
+    INSERT INTO posts_post_fts (posts_post_fts, rowid, text)
+    VALUES ('delete', old.id, old.text);
+    INSERT INTO posts_post_fts (rowid, text) VALUES (new.id, new.text);
+END;
+INSERT INTO posts_post_fts (posts_post_fts) VALUES ('rebuild');
+"""
+
+DROP_INDEX = """
+DROP TRIGGER posts_post_fts_update;
+DROP TRIGGER posts_post_fts_delete;
+DROP TRIGGER posts_post_fts_insert;
+DROP TABLE posts_post_fts;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_INDEX, DROP_INDEX),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 2.2.16 on 2026-10-17 18:13
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# сколько пар (подписчик, автор) с дублями обрабатывать за раз
+BATCH_SIZE = 500
+
+
+def count_of(model, field):
+    rows = (model.objects.filter(**{field: OuterRef('user_id')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total'))
+    return Coalesce(Subquery(rows), 0)
+
+
+def remove_duplicate_follows(apps, schema_editor):
+    """ Оставляет по одной подписке на пару и пересчитывает счётчики """
+    Follow = apps.get_model('posts', 'Follow')
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    duplicates = (Follow.objects.order_by()
+                  .values('user_id', 'author_id')
+                  .annotate(total=Count('pk'), keep=Min('pk'))
+                  .filter(total__gt=1))
+    affected = set()
+    while True:
+        # удалённые пары пропадают из выборки, поэтому берём всегда начало
+        batch = list(duplicates[:BATCH_SIZE])
+        if not batch:
+            break
+        for pair in batch:
+            Follow.objects.filter(
+                user_id=pair['user_id'], author_id=pair['author_id'],
+            ).exclude(pk=pair['keep']).delete()
+            affected.update((pair['user_id'], pair['author_id']))
+    affected = sorted(affected)
+    for start in range(0, len(affected), BATCH_SIZE):
+        AuthorStats.objects.filter(
+            user_id__in=affected[start:start + BATCH_SIZE],
+        ).update(
+            followers_count=count_of(Follow, 'author'),
+            following_count=count_of(Follow, 'user'),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0020_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_follows,
+                             migrations.RunPython.noop),
+        # уникальный индекс ограничения заменяет обычный
+        migrations.RemoveIndex(
+            model_name='follow',
+            name='follow_user_author_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_follower'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 2.2.16 on 2026-10-17 18:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# сколько комментариев обновлять за раз
+BATCH_SIZE = 500
+PATH_SEGMENT = 10
+
+
+def fill_paths(apps, schema_editor):
+    """ Прежние комментарии — корни веток: путь из одного их id """
+    Comment = apps.get_model('posts', 'Comment')
+    last_pk = 0
+    while True:
+        batch = list(Comment.objects.filter(pk__gt=last_pk).order_by('pk')
+                     .only('pk')[:BATCH_SIZE])
+        if not batch:
+            break
+        for comment in batch:
+            comment.path = f'{comment.pk:0{PATH_SEGMENT}d}'
+        Comment.objects.bulk_update(batch, ['path'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_unique_follow'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='posts.Comment', verbose_name='Ответ на комментарий'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, editable=False, max_length=99, verbose_name='Путь в ветке'),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'parent', 'path'], name='comment_post_parent_path_idx'),
+        ),
+    ]
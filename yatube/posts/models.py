@@ -1,14 +1,29 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from django.db.models.constraints import UniqueConstraint
 
+from .storage import content_storage
+
 User = get_user_model()
 
+# путь комментария — id его предков и его собственный, каждый дополнен
+# нулями до PATH_SEGMENT знаков и отделён PATH_SEPARATOR
+PATH_SEGMENT = 10
+PATH_SEPARATOR = '.'
+# ответы глубже MAX_DEPTH прикрепляются к предку на этой глубине
+MAX_DEPTH = 8
+
 
 class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
     description = models.TextField()
+    # денормализованный счётчик, обновляется вместе с постами группы
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число постов в группе',
+    )
 
     def __str__(self):
         return self.title
@@ -43,17 +58,34 @@ class Post(models.Model):
         verbose_name='Группа публикации',
         help_text='Укажите группу публикации',
     )
-    # Поле для картинки (необязательное)
+    # Поле для картинки (необязательное); одинаковые картинки хранятся
+    # одним файлом, имя которого — хеш содержимого
     image = models.ImageField(
         verbose_name='Изображение',
         upload_to='posts/',
+        storage=content_storage,
+        db_index=True,
         blank=True,
         null=True,
         help_text='Добавьте картинку к публикации',
     )
+    # денормализованный счётчик, обновляется вместе с комментариями
+    comments_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число комментариев',
+    )
 
     class Meta:
         ordering = ['-pub_date', ]
+        # ленты автора и группы: условие по первому полю и сортировка по
+        # дате читаются одним проходом по индексу
+        indexes = [
+            models.Index(fields=['author', 'pub_date'],
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=['group', 'pub_date'],
+                         name='post_group_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -87,15 +119,61 @@ class Comment(models.Model):
         auto_now_add=True,
         db_index=True
     )
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name='replies',
+        verbose_name='Ответ на комментарий',
+    )
+    # материализованный путь: ветка — диапазон путей, порядок путей —
+    # обход ветки в глубину
+    path = models.CharField(
+        max_length=(PATH_SEGMENT + len(PATH_SEPARATOR)) * (MAX_DEPTH + 1),
+        blank=True,
+        editable=False,
+        verbose_name='Путь в ветке',
+    )
 
     class Meta:
         ordering = ['-created']
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(fields=['post', 'created'],
+                         name='comment_post_created_idx'),
+            models.Index(fields=['post', 'path'],
+                         name='comment_post_path_idx'),
+            # корни веток поста: parent IS NULL, по порядку путей
+            models.Index(fields=['post', 'parent', 'path'],
+                         name='comment_post_parent_path_idx'),
+        ]
 
     def __str__(self):
         return self.text
 
+    @property
+    def depth(self):
+        """ Глубина в ветке: у корня 0 """
+        return len(self.path) // (PATH_SEGMENT + len(PATH_SEPARATOR))
+
+    def save(self, *args, **kwargs):
+        """ Новому комментарию путь дописывается после вставки: в путь
+        входит его собственный id """
+        if self.path:
+            return super().save(*args, **kwargs)
+        prefix = ''
+        if self.parent is not None:
+            ancestors = self.parent.path.split(PATH_SEPARATOR)[:MAX_DEPTH]
+            # слишком глубокий ответ становится соседом на MAX_DEPTH
+            self.parent_id = int(ancestors[-1])
+            prefix = PATH_SEPARATOR.join(ancestors) + PATH_SEPARATOR
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.path = f'{prefix}{self.pk:0{PATH_SEGMENT}d}'
+            Comment.objects.filter(pk=self.pk).update(path=self.path)
+
 
 class Follow(models.Model):
     # кто подписывается
@@ -114,4 +192,89 @@ class Follow(models.Model):
     )
 
     class Meta:
-        UniqueConstraint(fields=['user', 'author'], name='unique_follower')
+        # уникальный индекс заодно ускоряет проверку «подписан ли»
+        constraints = [
+            UniqueConstraint(fields=['user', 'author'],
+                             name='unique_follower'),
+        ]
+
+
+class AuthorStats(models.Model):
+    """ Денормализованные счётчики пользователя.
+
+    Обновляются в той же транзакции, что и посты с подписками, и
+    избавляют профиль и страницу поста от COUNT(*) по таблицам.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+    )
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число постов',
+    )
+    # сколько пользователей подписано на автора
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число подписчиков',
+    )
+    # на скольких авторов подписан пользователь
+    following_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число подписок',
+    )
+    # посты автора читаются при показе ленты, а не раскладываются по
+    # лентам; меняется только вместе с раскладкой, см. posts.feed
+    pulled = models.BooleanField(
+        default=False,
+        verbose_name='Посты читаются при показе ленты',
+    )
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+    def __str__(self):
+        return str(self.user)
+
+
+class FeedEntry(models.Model):
+    """ Запись материализованной ленты подписок.
+
+    Строка появляется у каждого подписчика при публикации поста, поэтому
+    лента /follow/ читается одним проходом по индексу (user, pub_date).
+    """
+    # чья это лента
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+    )
+    # автор поста, нужен чтобы быстро вычистить ленту после отписки
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    # копия post.pub_date, чтобы сортировать ленту без join с постами
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-pub_date', '-post_id']
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='feed_user_pub_date_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='feed_user_author_idx'),
+        ]
+        constraints = [
+            UniqueConstraint(fields=['user', 'post'],
+                             name='unique_feed_entry'),
+        ]
@@ -0,0 +1,149 @@
+import base64
+import binascii
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+# разделитель значений ключа внутри курсора
+CURSOR_SEPARATOR = '|'
+
+
+def encode_cursor(value, pk):
+    """ Упаковывает ключ (дата или число, id) в непрозрачный токен для URL """
+    value = value.isoformat() if hasattr(value, 'isoformat') else repr(value)
+    raw = f'{value}{CURSOR_SEPARATOR}{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token, parse=parse_datetime):
+    """ Распаковывает токен курсора, для битого токена вернёт None """
+    if not token:
+        return None
+    padding = '=' * (-len(token) % 4)
+    try:
+        raw = base64.urlsafe_b64decode(token + padding).decode()
+        value, pk = raw.rsplit(CURSOR_SEPARATOR, 1)
+        value = parse(value)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if value is None:
+        return None
+    return value, pk
+
+
+def keyset_window(queryset, keys, cursor, backwards, limit):
+    """ До ``limit`` записей выборки по одну сторону от курсора.
+
+    Записи всегда возвращаются в порядке ленты: от новых к старым.
+    """
+    first, second = keys
+    if cursor is not None:
+        value, pk = cursor
+        lookup = 'gt' if backwards else 'lt'
+        queryset = queryset.filter(
+            Q(**{f'{first}__{lookup}': value})
+            | Q(**{first: value, f'{second}__{lookup}': pk})
+        )
+    if backwards:
+        ordering = (first, second)
+    else:
+        ordering = (f'-{first}', f'-{second}')
+    rows = list(queryset.order_by(*ordering)[:limit])
+    if backwards:
+        rows.reverse()
+    return rows
+
+
+class CursorPaginator(Paginator):
+    """ Паджинатор по курсору (keyset pagination).
+
+    Страница выбирается условием по ключу сортировки ``(pub_date, id)``,
+    поэтому запрос не использует OFFSET и не считает COUNT(*), а новые
+    записи не сдвигают границы страниц. Для ``?page=N`` остаётся обычная
+    нумерованная страница Django.
+
+    Число записей для нумерованных страниц берётся из ``count``
+    (поддерживаемого счётчика), если он передан. Иначе с ``count_key``
+    COUNT(*) выполняется не чаще раза в ``PAGINATOR_COUNT_TIMEOUT``
+    секунд, а число страниц в шаблоне помечается как примерное.
+    """
+
+    # разбор первой части ключа из курсора
+    parse_key = staticmethod(parse_datetime)
+
+    def __init__(self, object_list, per_page, keys=('pub_date', 'pk'),
+                 count=None, count_key=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.keys = keys
+        self.known_count = count
+        self.count_key = count_key
+        self.approximate = False
+
+    @cached_property
+    def count(self):
+        if self.known_count is not None:
+            return self.known_count
+        if self.count_key is None:
+            return super().count
+        count = cache.get(self.count_key)
+        if count is None:
+            count = super().count
+            cache.set(self.count_key, count,
+                      settings.PAGINATOR_COUNT_TIMEOUT)
+        else:
+            # за время жизни в кеше записей могло стать больше или меньше
+            self.approximate = True
+        return count
+
+    def get_request_page(self, params):
+        """ Страница по параметрам запроса: ?page=, ?after= или ?before= """
+        if 'page' in params:
+            page = self.get_page(params.get('page'))
+            page.cursor_mode = False
+            page.next_cursor = page.previous_cursor = None
+            return page
+        return self.get_cursor_page(
+            after=params.get('after'),
+            before=params.get('before'),
+        )
+
+    def get_cursor_page(self, after=None, before=None):
+        """ Страница после курсора ``after`` или перед курсором ``before`` """
+        backwards = not after and bool(before)
+        cursor = decode_cursor(before if backwards else after,
+                               self.parse_key)
+        if cursor is None:
+            # без курсора (или с испорченным) отдаём первую страницу
+            backwards = False
+        rows = self._window(cursor, backwards, self.per_page + 1)
+        has_more = len(rows) > self.per_page
+        if has_more:
+            rows = rows[1:] if backwards else rows[:-1]
+        page = self._get_page(rows, 1, self)
+        page.cursor_mode = True
+        page.next_cursor = page.previous_cursor = None
+        if rows:
+            # листая назад, мы пришли со следующей страницы, она точно есть
+            has_next = backwards or has_more
+            has_previous = has_more if backwards else cursor is not None
+            if has_next:
+                page.next_cursor = self._cursor_for(rows[-1])
+            if has_previous:
+                page.previous_cursor = self._cursor_for(rows[0])
+        elif cursor is not None and not backwards:
+            # пролистали за последнюю запись: вернуться можно к курсору
+            page.previous_cursor = after
+        return page
+
+    def _cursor_for(self, obj):
+        first, second = self.keys
+        return encode_cursor(getattr(obj, first), getattr(obj, second))
+
+    def _window(self, cursor, backwards, limit):
+        return keyset_window(self.object_list, self.keys, cursor, backwards,
+                             limit)
@@ -0,0 +1,89 @@
+""" Полнотекстовый поиск по постам через SQLite FTS5.
+
+Таблица ``posts_post_fts`` хранит только индекс: текст берётся из
+``posts_post`` (external content), а триггеры из миграции обновляют индекс
+при вставке, правке и удалении постов. Поиск не сканирует таблицу постов,
+как ``LIKE '%q%'``.
+"""
+import re
+
+from django.db.models import FloatField, TextField
+from django.db.models.expressions import RawSQL
+from django.utils.functional import cached_property
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .paginator import CursorPaginator
+
+FTS_TABLE = 'posts_post_fts'
+# слова запроса: всё остальное (кавычки, операторы FTS5) отбрасывается
+WORD = re.compile(r'\w+')
+# сколько слов запроса учитывать
+MAX_WORDS = 8
+# границы найденных слов в отрывке; в тексте постов их не бывает
+MARK_START = '\x02'
+MARK_END = '\x03'
+# длина отрывка в словах
+SNIPPET_WORDS = 32
+
+
+def match_expression(query):
+    """ Безопасное выражение MATCH: все слова запроса как префиксы """
+    words = WORD.findall(query or '')[:MAX_WORDS]
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def matching_ids(expression):
+    """ Подзапрос с id постов, подходящих под выражение """
+    return RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        (expression,)
+    )
+
+
+def search_posts(queryset, query):
+    """ Посты, подходящие под запрос, с релевантностью и отрывком.
+
+    ``rank`` — bm25 со знаком минус: чем больше, тем релевантнее, поэтому
+    сортировка по убыванию, как у ленты по дате.
+    """
+    expression = match_expression(query)
+    found = queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = posts_post.id',
+               f'{FTS_TABLE} MATCH %s'],
+        params=[expression],
+    ).annotate(
+        rank=RawSQL(f'-bm25({FTS_TABLE})', (), output_field=FloatField()),
+        snippet=RawSQL(
+            f"snippet({FTS_TABLE}, 0, %s, %s, '…', %s)",
+            (MARK_START, MARK_END, SNIPPET_WORDS),
+            output_field=TextField(),
+        ),
+    ).order_by('-rank', '-pk')
+    # без слов искать нечего, но поля rank и snippet нужны паджинатору
+    return found if expression else found.none()
+
+
+def highlight(snippet):
+    """ Отрывок с найденными словами в <mark>; остальной текст экранирован """
+    return mark_safe(
+        escape(snippet)
+        .replace(MARK_START, '<mark>')
+        .replace(MARK_END, '</mark>')
+    )
+
+
+class SearchPaginator(CursorPaginator):
+    """ Листание результатов поиска по ключу (релевантность, id) """
+
+    parse_key = staticmethod(float)
+
+    def __init__(self, object_list, per_page, **kwargs):
+        super().__init__(object_list, per_page, keys=('rank', 'pk'),
+                         **kwargs)
+
+    @cached_property
+    def count(self):
+        # COUNT(*) поверх подзапроса с bm25() SQLite не выполняет
+        return self.object_list.order_by().values('pk').count()
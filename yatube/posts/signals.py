@@ -0,0 +1,164 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.cache import bump_tags
+
+from . import autocomplete, counters, feed, follow_graph, storage
+from .cache_tags import (INDEX_TAG, author_tag, card_tag, group_tag,
+                         post_tag, user_tag)
+from .models import Comment, Follow, Group, Post, User
+
+
+def _group_slugs(*group_ids):
+    group_ids = [pk for pk in group_ids if pk is not None]
+    if not group_ids:
+        return []
+    return list(Group.objects.filter(pk__in=group_ids)
+                .values_list('slug', flat=True))
+
+
+def _author_username(post):
+    """ Имя автора поста без обращения к удалённому автору.
+
+    При удалении пользователя порядок удаления связанных строк не
+    определён (у комментариев ссылка на самих себя), и автор поста может
+    быть уже удалён: тогда его профиль сбрасывает ``user_deleted``.
+    """
+    if Post.author.is_cached(post):
+        return post.author.username
+    return (User.objects.filter(pk=post.author_id)
+            .values_list('username', flat=True).first())
+
+
+def bump_post_tags(post, *group_ids):
+    """ Сбрасывает кеш страниц, на которых показан пост """
+    tags = [INDEX_TAG, post_tag(post.pk), card_tag(post.pk)]
+    username = _author_username(post)
+    if username is not None:
+        tags.append(author_tag(username))
+    tags.extend(group_tag(slug)
+                for slug in _group_slugs(post.group_id, *group_ids))
+    bump_tags(*tags)
+
+
+def bump_follow_tags(follow):
+    """ Сбрасывает кеш профилей обоих участников подписки """
+    bump_tags(*(author_tag(user.username)
+                for user in (follow.user, follow.author) if user is not None))
+
+
+@receiver(pre_save, sender=Post)
+def post_remember_group(sender, instance, **kwargs):
+    """ Запоминает прежние группу и картинку поста: счётчик группы
+    переносится, а ненужный файл картинки удаляется """
+    if instance.pk is not None:
+        previous = (Post.objects.filter(pk=instance.pk)
+                    .values_list('group_id', 'image').first())
+        if previous is not None:
+            (instance._previous_group_id,
+             instance._previous_image) = previous
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, **kwargs):
+    """ Новый пост сразу попадает в ленты подписчиков автора """
+    if created:
+        counters.bump_author(instance.author_id, 'posts_count', 1)
+        counters.bump_group(instance.group_id, 1)
+        feed.fan_out(instance)
+        bump_post_tags(instance)
+        return
+    previous_group_id = getattr(instance, '_previous_group_id', None)
+    previous_image = getattr(instance, '_previous_image', None)
+    if previous_image and previous_image != instance.image.name:
+        storage.release(previous_image)
+    if previous_group_id != instance.group_id:
+        counters.bump_group(previous_group_id, -1)
+        counters.bump_group(instance.group_id, 1)
+    bump_post_tags(instance, previous_group_id)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.bump_author(instance.author_id, 'posts_count', -1)
+    counters.bump_group(instance.group_id, -1)
+    storage.release(instance.image.name)
+    bump_post_tags(instance)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_comments(instance.post_id, 1)
+    bump_tags(post_tag(instance.post_id))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.bump_comments(instance.post_id, -1)
+    bump_tags(post_tag(instance.post_id))
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    """ После подписки в ленту добавляются прежние посты автора """
+    if created and instance.user_id and instance.author_id:
+        counters.bump_author(instance.author_id, 'followers_count', 1)
+        counters.bump_author(instance.user_id, 'following_count', 1)
+        feed.mark_pulled([instance.author_id])
+        feed.backfill(instance.user_id, instance.author_id)
+        follow_graph.changed(instance)
+        bump_follow_tags(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    """ После отписки посты автора убираются из ленты """
+    counters.bump_author(instance.author_id, 'followers_count', -1)
+    counters.bump_author(instance.user_id, 'following_count', -1)
+    feed.prune(instance.user_id, instance.author_id)
+    follow_graph.changed(instance)
+    bump_follow_tags(instance)
+
+
+@receiver(pre_save, sender=Group)
+def group_remember_slug(sender, instance, **kwargs):
+    """ Запоминает прежний адрес группы: его страница тоже устаревает """
+    if instance.pk is not None:
+        instance._previous_slug = (Group.objects.filter(pk=instance.pk)
+                                   .values_list('slug', flat=True).first())
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, **kwargs):
+    autocomplete.group_changed(instance)
+    tags = [group_tag(instance.slug)]
+    previous_slug = getattr(instance, '_previous_slug', None)
+    if previous_slug not in (None, instance.slug):
+        # ссылки на группу в ленте ведут по старому адресу
+        tags.extend([group_tag(previous_slug), INDEX_TAG])
+    bump_tags(*tags)
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    """ Посты группы отвязываются через UPDATE, без сигналов постов """
+    autocomplete.group_removed(instance)
+    bump_tags(group_tag(instance.slug), INDEX_TAG)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    """ Имя автора показано в карточках его постов """
+    # вход на сайт обновляет только last_login, карточки от этого не меняются
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    autocomplete.user_changed(instance)
+    bump_tags(user_tag(instance.pk))
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_deleted(sender, instance, **kwargs):
+    autocomplete.user_removed(instance)
+    bump_tags(author_tag(instance.username), user_tag(instance.pk))
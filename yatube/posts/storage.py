@@ -0,0 +1,162 @@
+""" Хранилище картинок постов по хешу содержимого.
+
+Файл получает имя из SHA-256 своего содержимого и лежит в подкаталогах
+по первым символам хеша: ``posts/ab/cd/abcd….jpg``. Одинаковые загрузки
+попадают в один файл, и sorl-thumbnail строит для них один набор
+миниатюр. Файл удаляется, когда на него не ссылается ни один пост.
+
+Новый пост может сослаться на уже лежащий файл в тот момент, когда
+другой запрос, не видя ещё этого поста, удаляет файл как ненужный.
+Поэтому проверка ссылок с удалением и проверка файла после фиксации
+нового поста идут под одной блокировкой в кеше, а пропавший файл
+записывается заново из загрузки.
+"""
+import hashlib
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from functools import partial
+
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from sorl.thumbnail import delete as delete_thumbnails
+from sorl.thumbnail.images import ImageFile
+
+# posts/ab/cd/<sha256>.<расширение>
+CONTENT_NAME = re.compile(
+    r'^(.*/)?(?P<a>[0-9a-f]{2})/(?P<b>[0-9a-f]{2})/'
+    r'(?P=a)(?P=b)[0-9a-f]{60}(\.\w+)?$')
+# сколько секунд держится блокировка файла и шаг её ожидания
+LOCK_TIMEOUT = 10
+LOCK_WAIT_STEP = 0.05
+
+
+class LockTimeout(Exception):
+    """ Блокировку файла не удалось взять за отведённое время """
+
+
+@contextmanager
+def locked(name):
+    """ Блокировка файла для всех процессов на время проверки ссылок.
+
+    Брошенная блокировка истекает через LOCK_TIMEOUT, поэтому ждём её
+    вдвое дольше; снимается только своя блокировка.
+    """
+    key = f'storage:lock:{name}'
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + 2 * LOCK_TIMEOUT
+    while not cache.add(key, token, LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            raise LockTimeout(name)
+        time.sleep(LOCK_WAIT_STEP)
+    try:
+        yield
+    finally:
+        if cache.get(key) == token:
+            cache.delete(key)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """ FileSystemStorage, где имя файла — хеш его содержимого """
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(
+            directory, digest[:2], digest[2:4], f'{digest}{extension}')
+
+    def get_available_name(self, name, max_length=None):
+        """ Имя по хешу не меняется: занятое имя значит, что такой файл
+        уже есть, и вместо нового имени поднимается FileExistsError """
+        if not is_content_name(name):
+            return super().get_available_name(name, max_length)
+        if self.exists(name):
+            raise FileExistsError(name)
+        return name
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        try:
+            return super().save(name, content, max_length)
+        except FileExistsError:
+            # такой файл уже загружали, в том числе одновременно с нами:
+            # ссылаемся на него же, но после фиксации поста проверяем,
+            # что его не успели удалить
+            transaction.on_commit(partial(self.restore, name, content))
+            return name
+
+    def _restore(self, name, content):
+        if not self.exists(name):
+            content.seek(0)
+            try:
+                self._save(name, content)
+            except FileExistsError:
+                pass
+
+    def restore(self, name, content):
+        """ Записывает файл заново, если его удалили как ненужный """
+        try:
+            with locked(name):
+                self._restore(name, content)
+        except LockTimeout:
+            # держатель блокировки завис, а файл нужен посту уже сейчас
+            self._restore(name, content)
+
+
+content_storage = ContentAddressedStorage()
+
+
+def is_content_name(name):
+    """ Назван ли файл по хешу содержимого """
+    return CONTENT_NAME.match(name) is not None
+
+
+def references(name):
+    """ Число постов, ссылающихся на файл """
+    from .models import Post
+
+    return Post.objects.filter(image=name).count()
+
+
+def delete_if_unused(name):
+    """ Удаляет файл и его миниатюры, если на него не ссылаются посты """
+    try:
+        with locked(name):
+            if references(name):
+                return False
+            # миниатюры и их записи в хранилище sorl больше не нужны
+            delete_thumbnails(ImageFile(name, content_storage),
+                              delete_file=False)
+            content_storage.delete(name)
+    except LockTimeout:
+        # лишний файл безопаснее оставить, чем удалить нужный
+        return False
+    return True
+
+
+def release(name):
+    """ После фиксации транзакции удаляет файл, если он больше не нужен.
+
+    Файлы со старыми именами не общие, их Django и раньше не удалял.
+    """
+    if name and is_content_name(name):
+        transaction.on_commit(partial(delete_if_unused, name))
+
+
+def rehash(name):
+    """ Копирует файл под имя по хешу содержимого, возвращает новое имя """
+    with content_storage.open(name) as content:
+        return content_storage.save(name, content)
@@ -0,0 +1,30 @@
+from django import template
+from django.conf import settings
+
+from .. import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_thumbnail(post, profile='card'):
+    """ Готовые миниатюры поста; если их нет, ставит построение в очередь
+
+    Пока миниатюра строится, шаблон показывает заглушку.
+    """
+    if not post.image:
+        return None
+    pictures = getattr(post, 'pictures', {})
+    if profile in pictures:
+        # миниатюры страницы уже загружены разом в pagination()
+        thumbnail = pictures[profile]
+    else:
+        thumbnail = thumbnails.cached_picture(post, profile)
+    if thumbnail is None:
+        if settings.THUMBNAIL_BACKGROUND:
+            thumbnails.enqueue(post.pk)
+        else:
+            # без фонового пула строим сразу, как {% thumbnail %} из sorl
+            thumbnails.build(post)
+            thumbnail = thumbnails.cached_picture(post, profile)
+    return thumbnail
@@ -0,0 +1,121 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from .. import autocomplete
+from ..autocomplete import GROUP, USER, PrefixIndex
+from ..models import Group
+
+User = get_user_model()
+
+
+class PrefixIndexTest(TestCase):
+    def test_prefix_search(self):
+        index = PrefixIndex()
+        index.add(USER, 1, *autocomplete.user_entry(
+            User(username='leo', first_name='Лев', last_name='Толстой')))
+        index.add(USER, 2, *autocomplete.user_entry(
+            User(username='fedor', first_name='Фёдор')))
+        index.add(GROUP, 1, *autocomplete.group_entry(
+            Group(title='Лесные прогулки', slug='forest')))
+        self.assertEqual(index.search('ЛЕ'), [
+            (USER, {'username': 'leo', 'name': 'Лев Толстой'}),
+            (GROUP, {'title': 'Лесные прогулки', 'slug': 'forest'}),
+        ])
+        # «ё» и «е» не различаются, запись с несколькими ключами — одна
+        self.assertEqual(len(index.search('федор')), 1)
+        self.assertEqual(index.search('прог', kind=USER), [])
+        self.assertEqual(len(index.search('л', limit=1)), 1)
+        index.remove(USER, 1)
+        self.assertEqual(index.search('толст'), [])
+        self.assertEqual(index.keys, sorted(index.keys))
+
+    def test_index_built_from_entries_sorted_once(self):
+        users = [User(pk=pk, username=f'user{pk}', first_name='Имя')
+                 for pk in (3, 1, 2)]
+        entries = [(USER, user.pk, *autocomplete.user_entry(user))
+                   for user in users]
+        index = PrefixIndex()
+        for entry in entries:
+            index.add(*entry)
+        built = PrefixIndex.from_entries(entries)
+        self.assertEqual(built.keys, index.keys)
+        self.assertEqual(built.entries, index.entries)
+
+
+class SuggestViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        User.objects.create_user(username='leo', first_name='Лев')
+        Group.objects.create(title='Лесные прогулки', slug='forest',
+                             description='Описание')
+
+    def setUp(self):
+        autocomplete.forget()
+        self.addCleanup(autocomplete.forget)
+
+    def test_suggestions_served_from_memory(self):
+        url = reverse('posts:suggest')
+        response = self.client.get(url, {'q': 'ле'})
+        self.assertEqual(response.json()['results'], [
+            {'kind': USER, 'url': reverse('posts:profile', args=('leo',)),
+             'username': 'leo', 'name': 'Лев'},
+            {'kind': GROUP,
+             'url': reverse('posts:group_list', args=('forest',)),
+             'title': 'Лесные прогулки', 'slug': 'forest'},
+        ])
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'q': 'лес', 'kind': GROUP})
+        self.assertEqual(len(response.json()['results']), 1)
+
+
+class IncrementalUpdateTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        autocomplete.forget()
+        self.addCleanup(autocomplete.forget)
+
+    def test_index_follows_saved_and_deleted_objects(self):
+        """Правки применяются к индексу на месте, без перестроения."""
+        index = autocomplete.get_index()
+        user = User.objects.create_user(username='anna')
+        group = Group.objects.create(title='Сад', slug='garden',
+                                     description='Описание')
+        self.assertIs(autocomplete.get_index(), index)
+        self.assertEqual(len(autocomplete.suggest('ann')), 1)
+        self.assertEqual(len(autocomplete.suggest('сад')), 1)
+        user.is_active = False
+        user.save()
+        group.delete()
+        self.assertEqual(autocomplete.suggest('ann'), [])
+        self.assertEqual(autocomplete.suggest('сад'), [])
+
+    def test_other_process_change_applied_in_place(self):
+        index = autocomplete.get_index()
+        # другой процесс сдвигает версию и кладёт изменение в кеш
+        user = User.objects.create_user(username='boris')
+        version = autocomplete.bump_tag(autocomplete.AUTOCOMPLETE_TAG)
+        cache.set(autocomplete._change_key(version),
+                  ('add', (USER, user.pk, *autocomplete.user_entry(user))))
+        autocomplete._checked = 0.0
+        with self.assertNumQueries(0):
+            self.assertIs(autocomplete.get_index(), index)
+        self.assertEqual(len(autocomplete.suggest('bor')), 1)
+
+    def test_lost_change_rebuilds_index_in_background(self):
+        index = autocomplete.get_index()
+        # изменение из другого процесса видно только по версии тега
+        User.objects.bulk_create([User(username='boris')])
+        autocomplete.bump_tag(autocomplete.AUTOCOMPLETE_TAG)
+        autocomplete._checked = 0.0
+        self.assertIs(autocomplete.get_index(), index)
+        # изменения нет и при следующей сверке: строим индекс заново,
+        # а пока отвечаем по старому
+        autocomplete._checked = 0.0
+        with self.assertNumQueries(0):
+            self.assertIs(autocomplete.get_index(), index)
+        autocomplete._rebuilding.join()
+        self.assertIsNot(autocomplete.get_index(), index)
+        self.assertEqual(len(autocomplete.suggest('bor')), 1)
@@ -0,0 +1,150 @@
+from http import HTTPStatus
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from .. import threads
+from ..models import MAX_DEPTH, Comment, Post
+from ..views import PAGE_COMMENTS
+
+User = get_user_model()
+
+# веток больше, чем помещается в одну порцию
+COMMENTS = PAGE_COMMENTS + 5
+
+
+class CommentPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(author=cls.author, text='Текст')
+        for number in range(COMMENTS):
+            Comment.objects.create(post=cls.post, author=cls.author,
+                                   text=f'Комментарий {number}')
+        cls.post.refresh_from_db()
+
+    def test_first_page_rendered_inline(self):
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,)))
+        comments = response.context['comments']
+        self.assertEqual(len(comments), PAGE_COMMENTS)
+        self.assertEqual(comments[0].text, f'Комментарий {COMMENTS - 1}')
+        self.assertEqual(response.context['post'].comments_count, COMMENTS)
+        self.assertIsNotNone(comments.next_cursor)
+        self.assertContains(response, 'data-comments-more')
+
+    def test_next_page_fetched_as_fragment(self):
+        url = reverse('posts:post_comments', args=(self.post.pk,))
+        first = self.client.get(url).context['comments']
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'after': first.next_cursor})
+        self.assertTemplateUsed(response, 'includes/comment_list.html')
+        self.assertTemplateNotUsed(response, 'base.html')
+        rest = response.context['comments']
+        self.assertIsNone(rest.next_cursor)
+        self.assertNotContains(response, 'data-comments-more')
+        texts = [comment.text for comment in (*first, *rest)]
+        self.assertEqual(texts, [f'Комментарий {number}'
+                                 for number in reversed(range(COMMENTS))])
+
+    def test_next_page_inline_without_javascript(self):
+        first = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,)),
+        ).context['comments']
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,)),
+            {'comments_after': first.next_cursor},
+        )
+        self.assertEqual(len(response.context['comments']),
+                         COMMENTS - PAGE_COMMENTS)
+
+    def test_fragment_of_missing_post(self):
+        response = self.client.get(
+            reverse('posts:post_comments', args=(self.post.pk + 1,)))
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class CommentThreadTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(author=cls.author, text='Текст')
+        cls.other_post = Post.objects.create(author=cls.author,
+                                             text='Другой текст')
+
+    def setUp(self):
+        self.client.force_login(self.author)
+
+    def comment(self, text, parent=None):
+        return Comment.objects.create(post=self.post, author=self.author,
+                                      text=text, parent=parent)
+
+    def test_thread_read_with_one_range_query(self):
+        first = self.comment('Первая ветка')
+        answer = self.comment('Ответ', first)
+        second = self.comment('Вторая ветка')
+        self.comment('Ответ на ответ', answer)
+        self.comment('Второй ответ', first)
+        self.assertEqual(answer.depth, 1)
+        with self.assertNumQueries(1):
+            texts = [comment.text for comment in threads.subtree(first)]
+        self.assertEqual(texts, ['Первая ветка', 'Ответ', 'Ответ на ответ',
+                                 'Второй ответ'])
+        with self.assertNumQueries(1):
+            page = threads.threads_page(self.post, PAGE_COMMENTS)
+        # новые ветки сверху, ответы внутри ветки — по порядку
+        self.assertEqual([comment.text for comment in page], [
+            'Вторая ветка', 'Первая ветка', 'Ответ', 'Ответ на ответ',
+            'Второй ответ',
+        ])
+        self.assertIsNone(page.next_cursor)
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,)))
+        self.assertContains(response, f'id="comment-{second.pk}"')
+
+    def test_threads_are_not_split_between_pages(self):
+        roots = [self.comment(f'Ветка {number}') for number in range(3)]
+        for number in range(3):
+            self.comment(f'Ответ {number}', roots[1])
+        page = threads.threads_page(self.post, 2)
+        self.assertEqual(len(page), 5)
+        self.assertEqual(page.next_cursor, roots[1].pk)
+        rest = threads.threads_page(self.post, 2, page.next_cursor)
+        self.assertEqual([comment.text for comment in rest], ['Ветка 0'])
+        self.assertIsNone(rest.next_cursor)
+
+    def test_deep_reply_attached_at_max_depth(self):
+        comment = self.comment('Корень')
+        for number in range(MAX_DEPTH + 2):
+            comment = self.comment(f'Ответ {number}', comment)
+        self.assertEqual(comment.depth, MAX_DEPTH)
+        self.assertEqual(comment.parent.depth, MAX_DEPTH - 1)
+
+    def test_reply_form_creates_reply(self):
+        parent = self.comment('Вопрос')
+        foreign = Comment.objects.create(post=self.other_post,
+                                         author=self.author, text='Чужой')
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,)),
+            {'reply_to': parent.pk},
+        )
+        self.assertContains(response, f'name="parent" value="{parent.pk}"')
+        url = reverse('posts:add_comment', args=(self.post.pk,))
+        self.client.post(url, {'text': 'Ответ', 'parent': parent.pk})
+        self.client.post(url, {'text': 'Не ответ', 'parent': foreign.pk})
+        self.assertEqual(Comment.objects.get(text='Ответ').parent, parent)
+        self.assertIsNone(Comment.objects.get(text='Не ответ').parent)
+
+    def test_author_with_threads_can_be_deleted(self):
+        """Ссылка комментариев на самих себя не мешает удалить автора."""
+        author = User.objects.create_user(username='leaving')
+        post = Post.objects.create(author=author, text='Текст')
+        root = Comment.objects.create(post=post, author=author, text='Вопрос')
+        Comment.objects.create(post=post, author=self.author, text='Ответ',
+                               parent=root)
+        author.delete()
+        self.assertFalse(Post.objects.filter(pk=post.pk).exists())
+        self.assertFalse(Comment.objects.filter(post_id=post.pk).exists())
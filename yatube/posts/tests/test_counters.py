@@ -0,0 +1,106 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..models import AuthorStats, Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.new_group = Group.objects.create(
+            title='Другая группа',
+            slug='new-slug',
+            description='Тестовое описание',
+        )
+
+    def assertCounters(self, user, **expected):
+        stats = AuthorStats.objects.get(user=user)
+        for field, value in expected.items():
+            with self.subTest(field=field):
+                self.assertEqual(getattr(stats, field), value)
+
+    def test_post_and_comment_counters(self):
+        """Счётчики постов и комментариев следуют за созданием, переносом
+        в другую группу и удалением."""
+        post = Post.objects.create(author=self.author, group=self.group,
+                                   text='Текст')
+        Post.objects.create(author=self.author, group=self.group,
+                            text='Текст')
+        Comment.objects.create(post=post, author=self.reader, text='Текст')
+        self.assertCounters(self.author, posts_count=2)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 2)
+
+        post.group = self.new_group
+        post.save()
+        self.group.refresh_from_db()
+        self.new_group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(self.new_group.posts_count, 1)
+
+        post.delete()
+        self.assertCounters(self.author, posts_count=1)
+        self.new_group.refresh_from_db()
+        self.assertEqual(self.new_group.posts_count, 0)
+
+    def test_follow_counters(self):
+        """Подписка и отписка меняют счётчики обоих пользователей."""
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertCounters(self.author, followers_count=1)
+        self.assertCounters(self.reader, following_count=1)
+        follow.delete()
+        self.assertCounters(self.author, followers_count=0)
+        self.assertCounters(self.reader, following_count=0)
+
+    def test_recount_command_repairs_drift(self):
+        """Команда recount_counters исправляет разошедшиеся счётчики."""
+        post = Post.objects.create(author=self.author, group=self.group,
+                                   text='Текст')
+        Comment.objects.create(post=post, author=self.reader, text='Текст')
+        Follow.objects.create(user=self.reader, author=self.author)
+        AuthorStats.objects.update(posts_count=42, followers_count=42)
+        Post.objects.update(comments_count=42)
+        Group.objects.update(posts_count=42)
+        call_command('recount_counters', batch_size=1, stdout=StringIO())
+        self.assertCounters(self.author, posts_count=1, followers_count=1)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+
+    def test_deleting_with_drifted_counters_stops_at_zero(self):
+        """Удаление при разошедшихся с таблицами счётчиках не уводит их
+        ниже нуля."""
+        author = User.objects.create_user(username='bulk_author')
+        # bulk_create не отправляет сигналов: счётчики остаются нулевыми
+        Post.objects.bulk_create([
+            Post(author=author, group=self.group, text='Текст'),
+        ])
+        post = Post.objects.get(author=author)
+        Comment.objects.bulk_create([
+            Comment(post=post, author=self.reader, text='Текст'),
+        ])
+        Follow.objects.bulk_create([Follow(user=self.reader, author=author)])
+        AuthorStats.objects.get_or_create(user=self.reader)
+        Follow.objects.get(author=author).delete()
+        # вместе с постом удаляется и комментарий
+        post.delete()
+        self.assertFalse(Comment.objects.filter(post_id=post.pk).exists())
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 0)
+        self.assertCounters(self.reader, following_count=0)
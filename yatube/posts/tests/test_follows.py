@@ -1,9 +1,25 @@
+import os
+import tempfile
+import threading
+import time
 from http import HTTPStatus
+from io import StringIO
+from unittest import mock
 
-from django.test import Client, TestCase
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from ..models import Follow, Post, User
+from .. import follow_graph, follows
+from ..models import AuthorStats, FeedEntry, Follow, Post, User
+
+# потоков и нажатий в каждом для проверки одновременных подписок
+THREADS = 8
+CLICKS = 25
 
 
 class FollowTest(TestCase):
@@ -82,3 +98,329 @@ class FollowTest(TestCase):
         user_response = self.authorized_client.get(follow_index_url)
         user_content = user_response.context['page_obj']
         self.assertNotIn(post, user_content)
+
+    def test_follow_backfills_and_unfollow_prunes_feed(self):
+        """Подписка добавляет в ленту прежние посты автора, отписка
+        убирает их."""
+        post = Post.objects.create(
+            author=self.test_author,
+            text='Пост до подписки',
+        )
+        self.authorized_client.get(
+            reverse('posts:profile_follow', args=[self.test_author.username]))
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.test_user, post=post).exists())
+        self.authorized_client.get(
+            reverse('posts:profile_unfollow',
+                    args=[self.test_author.username]))
+        self.assertFalse(FeedEntry.objects.filter(
+            user=self.test_user).exists())
+
+    def test_follow_index_reads_only_feed_table(self):
+        """Лента подписок читается из материализованной ленты без join
+        с таблицей подписок."""
+        Follow.objects.create(user=self.test_user, author=self.test_author)
+        Post.objects.create(author=self.test_author, text='Текст')
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_client.get(reverse('posts:follow_index'))
+        feed_queries = [query['sql'] for query in queries.captured_queries
+                        if 'posts_feedentry' in query['sql']]
+        self.assertEqual(len(feed_queries), 1)
+        self.assertNotIn('posts_follow', feed_queries[0])
+
+    @override_settings(FEED_PULL_THRESHOLD=2)
+    def test_popular_author_posts_are_pulled_and_merged(self):
+        """Посты популярного автора не раскладываются по лентам, но
+        попадают в ленту подписок вперемешку с остальными по дате."""
+        popular = User.objects.create(username='popular')
+        another_reader = User.objects.create(username='reader')
+        Follow.objects.create(user=another_reader, author=popular)
+        Follow.objects.create(user=self.test_user, author=popular)
+        Follow.objects.create(user=self.test_user, author=self.test_author)
+        posts = [
+            Post.objects.create(author=author, text=str(number))
+            for number, author in enumerate(
+                [popular, self.test_author, popular, self.test_author])
+        ]
+        self.assertFalse(FeedEntry.objects.filter(author=popular).exists())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']),
+                         posts[::-1])
+        response = self.authorized_client.get(
+            reverse('posts:follow_index'), {'page': 1})
+        self.assertEqual(list(response.context['page_obj']),
+                         posts[::-1])
+
+    @override_settings(FEED_PULL_THRESHOLD=3, FEED_PUSH_THRESHOLD=2)
+    def test_author_crossing_pull_threshold_stays_in_feed(self):
+        """Посты автора не пропадают из ленты, когда он становится
+        популярным и когда перестаёт им быть; у порога автор не
+        переключается, а обратно в ленты его раскладывает push_feeds."""
+        author = User.objects.create(username='rising')
+        readers = [User.objects.create(username=f'reader{number}')
+                   for number in range(2)]
+        Post.objects.create(author=author, text='Обычный автор')
+        for reader in [self.test_user, *readers]:
+            follows.follow(reader, author)
+        pulled_post = Post.objects.create(author=author,
+                                          text='Популярный автор')
+        self.assertFalse(FeedEntry.objects.filter(post=pulled_post).exists())
+        url = reverse('posts:follow_index')
+        response = self.authorized_client.get(url)
+        self.assertEqual(len(response.context['page_obj']), 2)
+
+        def push_feeds():
+            output = StringIO()
+            call_command('push_feeds', stdout=output)
+            cache.clear()
+            return output.getvalue()
+
+        # между порогами отписки и подписки ничего не переключают
+        follows.unfollow(readers[0], author)
+        follows.follow(readers[0], author)
+        follows.unfollow(readers[0], author)
+        self.assertIn('авторов: 0', push_feeds())
+        self.assertTrue(AuthorStats.objects.get(user=author).pulled)
+        follows.unfollow(readers[1], author)
+        self.assertFalse(FeedEntry.objects.filter(post=pulled_post).exists())
+        response = self.authorized_client.get(url)
+        self.assertEqual(len(response.context['page_obj']), 2)
+        self.assertIn('авторов: 1', push_feeds())
+        self.assertFalse(AuthorStats.objects.get(user=author).pulled)
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.test_user, post=pulled_post).exists())
+        response = self.authorized_client.get(url)
+        self.assertEqual(len(response.context['page_obj']), 2)
+        self.assertFalse(FeedEntry.objects.filter(
+            user__in=readers).exists())
+
+
+class FollowGraphTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.users = [User.objects.create(username=f'user{number}')
+                     for number in range(4)]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_graph_follows_subscriptions(self):
+        """Списки подписок берутся из кеша и обновляются при подписке
+        и отписке."""
+        first, second, third, _ = self.users
+        Follow.objects.create(user=first, author=third)
+        Follow.objects.create(user=first, author=second)
+        Follow.objects.create(user=second, author=first)
+        self.assertEqual(list(follow_graph.following_ids(first.pk)),
+                         sorted([second.pk, third.pk]))
+        self.assertFalse(follow_graph.is_following(third.pk, first.pk))
+        # загруженные списки читаются из кеша
+        with self.assertNumQueries(0):
+            self.assertTrue(follow_graph.is_following(first.pk, third.pk))
+            self.assertFalse(follow_graph.is_following(third.pk, first.pk))
+        self.assertEqual(list(follow_graph.mutual_ids(first.pk)),
+                         [second.pk])
+        self.assertTrue(follow_graph.is_mutual(second.pk, first.pk))
+
+        Follow.objects.filter(user=first, author=second).delete()
+        self.assertFalse(follow_graph.is_following(first.pk, second.pk))
+        self.assertEqual(list(follow_graph.follower_ids(second.pk)), [])
+        self.assertEqual(list(follow_graph.mutual_ids(first.pk)), [])
+        self.assertFalse(follow_graph.is_following(None, first.pk))
+
+    def test_profile_shows_mutual_follow(self):
+        first, second, _, _ = self.users
+        Follow.objects.create(user=second, author=first)
+        client = Client()
+        client.force_login(first)
+        url = reverse('posts:profile', args=[second.username])
+        response = client.get(url)
+        self.assertFalse(response.context['following'])
+        self.assertFalse(response.context['mutual'])
+        client.get(reverse('posts:profile_follow', args=[second.username]))
+        response = client.get(url)
+        self.assertTrue(response.context['following'])
+        self.assertTrue(response.context['mutual'])
+
+
+class FollowRaceTest(TransactionTestCase):
+    """Одновременные подписки и отписки не создают дублей и не сбивают
+    счётчики."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author')
+        self.reader = User.objects.create(username='reader')
+        Post.objects.create(author=self.author, text='Текст')
+
+    def click(self, action):
+        for _ in range(CLICKS):
+            while True:
+                try:
+                    action(self.reader, self.author)
+                    break
+                except OperationalError:
+                    # база занята другим потоком: как браузер, пробуем снова
+                    time.sleep(0.001)
+        connection.close()
+
+    def run_threads(self, actions):
+        threads = [threading.Thread(target=self.click, args=(action,))
+                   for action in actions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def assertConsistent(self):
+        follows_count = Follow.objects.filter(user=self.reader,
+                                              author=self.author).count()
+        self.assertLessEqual(follows_count, 1)
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.author).followers_count,
+            follows_count)
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.reader).following_count,
+            follows_count)
+        self.assertEqual(
+            FeedEntry.objects.filter(user=self.reader).count(),
+            follows_count)
+        return follows_count
+
+    def test_concurrent_follow_clicks(self):
+        self.run_threads([follows.follow] * THREADS)
+        self.assertEqual(self.assertConsistent(), 1)
+
+    def test_concurrent_follow_and_unfollow_clicks(self):
+        self.run_threads([follows.follow, follows.unfollow] * (THREADS // 2))
+        self.assertConsistent()
+        follows.unfollow(self.reader, self.author)
+        self.assertEqual(self.assertConsistent(), 0)
+
+
+@mock.patch('posts.follows.HAS_RETURNING', False)
+class FollowRaceWithoutReturningTest(FollowRaceTest):
+    """То же на SQLite старше 3.35, где нет RETURNING."""
+
+    def test_follow_and_unfollow_report_changes(self):
+        self.assertTrue(follows.follow(self.reader, self.author))
+        self.assertFalse(follows.follow(self.reader, self.author))
+        self.assertEqual(self.assertConsistent(), 1)
+        self.assertTrue(follows.unfollow(self.reader, self.author))
+        self.assertFalse(follows.unfollow(self.reader, self.author))
+        self.assertEqual(self.assertConsistent(), 0)
+
+
+class FollowImportTest(TestCase):
+    """Импорт и экспорт графа подписок, пакетная подписка."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+        cls.reader = User.objects.create(username='reader')
+        cls.other = User.objects.create(username='other')
+        Post.objects.create(author=cls.author, text='Текст')
+
+    def setUp(self):
+        cache.clear()
+
+    def import_file(self, content, suffix):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False,
+                                         encoding='utf-8') as file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        output = StringIO()
+        call_command('import_follows', file.name, batch_size=2,
+                     stdout=output)
+        return output.getvalue()
+
+    def test_import_csv_skips_unknown_self_and_duplicates(self):
+        Follow.objects.create(user=self.other, author=self.author)
+        self.assertEqual(list(follow_graph.following_ids(self.reader.pk)),
+                         [])
+        output = self.import_file(
+            'user,author\n'
+            'reader,author\n'
+            'reader,author\n'
+            'reader,reader\n'
+            'ghost,author\n'
+            'other,author\n'
+            'reader,other\n',
+            '.csv',
+        )
+        self.assertIn('создано подписок: 2, пропущено: 4', output)
+        self.assertEqual(Follow.objects.count(), 3)
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.author).followers_count, 2)
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.reader).following_count, 2)
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.reader, post__author=self.author).exists())
+        self.assertEqual(list(follow_graph.following_ids(self.reader.pk)),
+                         sorted([self.author.pk, self.other.pk]))
+
+    def test_import_ndjson_and_export_round_trip(self):
+        self.import_file(
+            '{"user": "reader", "author": "author"}\n'
+            '\n'
+            '{"user": "author", "author": "other"}\n',
+            '.ndjson',
+        )
+        output = StringIO()
+        call_command('export_follows', format='csv', batch_size=1,
+                     stdout=output)
+        header, *rows = output.getvalue().splitlines()
+        self.assertEqual(header, 'user,author')
+        self.assertCountEqual(rows, ['reader,author', 'author,other'])
+        Follow.objects.all().delete()
+        self.import_file(output.getvalue(), '.csv')
+        self.assertEqual(
+            set(Follow.objects.values_list('user__username',
+                                           'author__username')),
+            {('reader', 'author'), ('author', 'other')},
+        )
+
+    def test_import_rejects_malformed_file(self):
+        with self.assertRaises(CommandError):
+            self.import_file('{"user": "reader"\n', '.ndjson')
+
+    def test_batch_endpoint_follows_only_current_user(self):
+        client = Client()
+        client.force_login(self.reader)
+        response = client.post(
+            reverse('posts:follow_batch'),
+            'user,author\n,author\nreader,other\nother,author\n',
+            content_type='text/csv',
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.json(), {
+            'read': 3, 'created': 2, 'skipped': 0, 'forbidden': 1,
+        })
+        self.assertEqual(
+            set(Follow.objects.values_list('user__username',
+                                           'author__username')),
+            {('reader', 'author'), ('reader', 'other')},
+        )
+
+    def test_batch_endpoint_rejects_bad_body(self):
+        client = Client()
+        client.force_login(self.reader)
+        response = client.post(reverse('posts:follow_batch'), '[1, 2]\n',
+                               content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        response = client.get(reverse('posts:follow_batch'))
+        self.assertEqual(response.status_code, HTTPStatus.METHOD_NOT_ALLOWED)
+
+    def test_batch_endpoint_rejects_non_string_names(self):
+        client = Client()
+        client.force_login(self.reader)
+        for line in ('{"user": ["reader"], "author": "author"}\n',
+                     '{"author": {"name": "author"}}\n'):
+            with self.subTest(line=line):
+                response = client.post(reverse('posts:follow_batch'), line,
+                                       content_type='application/x-ndjson')
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.BAD_REQUEST)
+        self.assertFalse(Follow.objects.exists())
@@ -1,6 +1,10 @@
 import shutil
 import tempfile
 from http import HTTPStatus
+from io import BytesIO
+from unittest import mock
+
+from PIL import Image
 
 from django.contrib.auth import get_user_model
 from django.test import Client, TestCase, override_settings
@@ -82,11 +86,14 @@ class PostFormTest(TestCase):
                 'posts:profile',
                 kwargs={'username': f'{self.user}'}
             ))
-        self.assertTrue(Post.objects.filter(
+        post = Post.objects.filter(
             text=form_data['text'],
             group=self.group.id,
-            image='posts/small.gif',
-        ).first())
+        ).exclude(image='').first()
+        self.assertTrue(post)
+        # картинка хранится под именем из хеша содержимого
+        self.assertRegex(post.image.name,
+                         r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.gif$')
 
     def test_upload_not_image(self):
         """Проверка формы создания поста с загрузкой не поддерживаемого
@@ -183,6 +190,116 @@ class PostFormTest(TestCase):
         self.assertEqual(Post.objects.count(), posts_before)
 
 
+def image_file(name, size, format_, **options):
+    output = BytesIO()
+    frames = options.pop('frames', 1)
+    image = Image.new('RGB', size, (255, 0, 0))
+    if frames > 1:
+        options.update(save_all=True, append_images=[
+            Image.new('RGB', size, (0, 0, 100 * number))
+            for number in range(frames - 1)
+        ])
+    image.save(output, format_, **options)
+    return SimpleUploadedFile(name, output.getvalue(), f'image/{format_}')
+
+
+@override_settings(IMAGE_MAX_SIDE=100, IMAGE_MAX_PIXELS=200_000,
+                   IMAGE_MAX_FRAMES=2)
+class ImageIngestTest(TestCase):
+    def clean(self, upload):
+        form = PostForm(data={'text': 'Текст'}, files={'image': upload})
+        form.is_valid()
+        return form
+
+    def test_large_image_downscaled_and_rotated_without_metadata(self):
+        """Большая картинка уменьшается, поворачивается по EXIF и
+        сохраняется без метаданных."""
+        exif = Image.Exif()
+        # поворот на 90° по часовой стрелке
+        exif[0x0112] = 6
+        form = self.clean(image_file('big.jpeg', (400, 200), 'JPEG',
+                                     exif=exif.tobytes()))
+        self.assertTrue(form.is_valid(), form.errors)
+        stored = Image.open(form.cleaned_data['image'])
+        self.assertEqual(stored.size, (50, 100))
+        self.assertEqual(stored.format, 'JPEG')
+        self.assertNotIn('exif', stored.info)
+        self.assertEqual(form.cleaned_data['image'].name, 'big.jpg')
+
+    def test_png_and_gif_stored_without_metadata(self):
+        """EXIF, ICC и комментарий из PNG и GIF не сохраняются."""
+        exif = Image.Exif()
+        # GPS IFD
+        exif[0x8825] = {2: (55.0, 45.0, 0.0)}
+        uploads = (
+            image_file('photo.png', (20, 20), 'PNG', exif=exif.tobytes(),
+                       icc_profile=b'profile'),
+            image_file('still.gif', (20, 20), 'GIF', comment=b'secret'),
+        )
+        for upload in uploads:
+            with self.subTest(name=upload.name):
+                self.assertTrue(Image.open(upload).info)
+                upload.seek(0)
+                form = self.clean(upload)
+                self.assertTrue(form.is_valid(), form.errors)
+                stored = Image.open(form.cleaned_data['image'])
+                for key in ('exif', 'icc_profile', 'comment'):
+                    self.assertNotIn(key, stored.info)
+
+    def test_truncated_image_rejected(self):
+        """Обрезанный JPEG не принимается, а не роняет форму."""
+        upload = image_file('cut.jpeg', (400, 200), 'JPEG')
+        content = upload.read()
+        form = self.clean(SimpleUploadedFile(
+            'cut.jpeg', content[:len(content) // 2], 'image/jpeg'))
+        self.assertIn('image', form.errors)
+
+    def test_too_many_pixels_rejected(self):
+        """Картинка больше IMAGE_MAX_PIXELS не принимается."""
+        form = self.clean(image_file('huge.png', (500, 500), 'PNG'))
+        self.assertIn('image', form.errors)
+
+    def test_too_many_frames_rejected(self):
+        """Анимация длиннее IMAGE_MAX_FRAMES кадров не принимается, а
+        короткая пересобирается по кадрам без метаданных."""
+        form = self.clean(image_file('long.gif', (10, 10), 'GIF', frames=3))
+        self.assertIn('image', form.errors)
+        upload = image_file('short.gif', (10, 10), 'GIF', frames=2,
+                            duration=[70, 120], loop=0,
+                            comment=b'secret')
+        form = self.clean(upload)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertIsNot(form.cleaned_data['image'], upload)
+        stored = Image.open(form.cleaned_data['image'])
+        self.assertEqual(stored.format, 'GIF')
+        self.assertEqual(stored.n_frames, 2)
+        self.assertNotIn('comment', stored.info)
+        self.assertEqual(stored.info['duration'], 70)
+        stored.seek(1)
+        self.assertEqual(stored.info['duration'], 120)
+
+    def test_mpo_stored_as_jpeg(self):
+        """MPO с камеры обрабатывается как JPEG: первый кадр уменьшается,
+        поворачивается и сохраняется без метаданных."""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        upload = image_file('camera.jpeg', (400, 200), 'JPEG',
+                            exif=exif.tobytes())
+        image = Image.open(upload)
+        upload.seek(0)
+        # Pillow не записывает многокадровые MPO: выдаём JPEG за MPO
+        # с двумя кадрами, как его открыл бы MpoImagePlugin
+        image.format = 'MPO'
+        image.n_frames = 2
+        with mock.patch('posts.images._open', return_value=image):
+            form = self.clean(upload)
+        self.assertTrue(form.is_valid(), form.errors)
+        stored = Image.open(form.cleaned_data['image'])
+        self.assertEqual(stored.format, 'JPEG')
+        self.assertEqual(stored.size, (50, 100))
+        self.assertNotIn('exif', stored.info)
+
+
 class CommentFormTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -0,0 +1,138 @@
+from http import HTTPStatus
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .. import feed
+from ..models import Comment, Follow, Group, Post
+from ..views import PAGE_COMMENTS
+
+User = get_user_model()
+
+# полные проходы, нужные по смыслу: форма поста предлагает все группы
+FULL_SCANS = {'SCAN posts_group'}
+
+
+def query_plan(sql):
+    """ Строки EXPLAIN QUERY PLAN для уже подставленного SQL """
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def plan_problems(sql):
+    """ Полные проходы по таблицам и сортировки во временном B-дереве.
+
+    Проход по индексу допустим только в запросе без WHERE: ленты читают
+    его по порядку и останавливаются на LIMIT, а COUNT(*) читает самый
+    узкий индекс. С условием проход по индексу проверяет каждую строку,
+    это тот же полный проход. Виртуальная таблица FTS5 сама выбирает
+    подходящие строки, а сортировать найденное по релевантности без
+    B-дерева нельзя: bm25 считается при запросе.
+    """
+    plan = query_plan(sql)
+    full_text = any('VIRTUAL TABLE' in detail for detail in plan)
+    problems = []
+    for detail in plan:
+        if 'TEMP B-TREE' in detail and not full_text:
+            problems.append(detail)
+        elif (detail.startswith('SCAN ') and 'VIRTUAL TABLE' not in detail
+                and detail not in FULL_SCANS
+                and ('USING' not in detail or ' WHERE ' in sql)):
+            problems.append(detail)
+    return problems
+
+
+class QueryPlanTest(TestCase):
+    """ Каждый запрос страниц с постами идёт по индексу """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for number in range(15):
+            Post.objects.create(author=cls.author, group=cls.group,
+                                text=f'Пост номер {number}')
+        cls.post = Post.objects.first()
+        # веток больше, чем помещается в одну порцию, и с ответами
+        for number in range(PAGE_COMMENTS + 3):
+            root = Comment.objects.create(post=cls.post, author=cls.reader,
+                                          text=f'Комментарий {number}')
+            Comment.objects.create(post=cls.post, author=cls.author,
+                                   text='Ответ', parent=root)
+
+    def setUp(self):
+        self.client.force_login(self.reader)
+
+    def pages(self, pulled=False):
+        """ Адреса всех страниц, в том числе следующих по курсору, и
+        индекс, по которому страница обязана искать свои строки """
+        feed_index = ('post_author_pub_date_idx' if pulled
+                      else 'feed_user_pub_date_idx')
+        feeds = [
+            (reverse('posts:index'), None),
+            (reverse('posts:group_list', args=(self.group.slug,)),
+             'post_group_pub_date_idx'),
+            (reverse('posts:profile', args=(self.author.username,)),
+             'post_author_pub_date_idx'),
+            (reverse('posts:follow_index'), feed_index),
+            (f"{reverse('posts:search')}?q=пост", None),
+        ]
+        for url, index in feeds:
+            separator = '&' if '?' in url else '?'
+            yield url, index
+            yield f'{url}{separator}page=2', index
+            cache.clear()
+            cursor = self.client.get(url).context['page_obj'].next_cursor
+            yield f'{url}{separator}after={cursor}', index
+            yield f'{url}{separator}before={cursor}', index
+        yield (reverse('posts:post_detail', args=(self.post.pk,)),
+               'comment_post_path_idx')
+        comments = reverse('posts:post_comments', args=(self.post.pk,))
+        cursor = self.client.get(comments).context['comments'].next_cursor
+        url = f'{comments}?after={cursor}'
+        self.assertTrue(self.client.get(url).context['comments'])
+        yield url, 'comment_post_path_idx'
+        yield reverse('posts:post_create'), None
+        self.client.force_login(self.author)
+        yield reverse('posts:post_edit', args=(self.post.pk,)), None
+
+    def assertIndexedQueries(self, pulled=False):
+        for url, index in self.pages(pulled):
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url).status_code,
+                                 HTTPStatus.OK)
+            plans = []
+            for query in queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT'):
+                    continue
+                plans.extend(query_plan(sql))
+                with self.subTest(url=url, sql=sql):
+                    self.assertEqual(plan_problems(sql), [])
+            if index is not None:
+                with self.subTest(url=url, index=index):
+                    self.assertTrue(any(
+                        detail.startswith('SEARCH ')
+                        and f'INDEX {index} ' in detail
+                        for detail in plans), plans)
+
+    def test_pushed_feed_queries_use_indexes(self):
+        self.assertIndexedQueries()
+
+    @override_settings(FEED_PULL_THRESHOLD=1)
+    def test_pulled_feed_queries_use_indexes(self):
+        self.assertEqual(feed.mark_pulled(), 1)
+        self.assertIndexedQueries(pulled=True)
@@ -0,0 +1,83 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from ..models import Post
+from ..search import match_expression, search_posts
+
+User = get_user_model()
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin')
+
+    def setUp(self):
+        cache.clear()
+
+    def found(self, query):
+        return list(search_posts(Post.objects.all(), query)
+                    .values_list('pk', flat=True))
+
+    def test_index_follows_posts(self):
+        """Индекс обновляется при создании, правке и удалении поста."""
+        post = Post.objects.create(author=self.author, text='Летний лес')
+        self.assertEqual(self.found('лес'), [post.pk])
+        # слова ищутся по префиксу и без учёта регистра
+        self.assertEqual(self.found('ЛЕТН'), [post.pk])
+        post.text = 'Зимнее поле'
+        post.save()
+        self.assertEqual(self.found('лес'), [])
+        self.assertEqual(self.found('поле'), [post.pk])
+        post.delete()
+        self.assertEqual(self.found('поле'), [])
+
+    def test_query_syntax_is_not_passed_to_fts(self):
+        """Операторы FTS5 из запроса не ломают поиск."""
+        self.assertEqual(match_expression('лес" OR NEAR(*'),
+                         '"лес"* "OR"* "NEAR"*')
+        self.assertEqual(match_expression('"*()'), '')
+        response = self.client.get(reverse('posts:search'), {'q': '"*()'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+    def test_ranked_highlighted_and_paginated(self):
+        """Релевантные посты выше, найденные слова выделены, а ссылки
+        на следующую страницу сохраняют запрос."""
+        Post.objects.bulk_create([
+            Post(author=self.author, text=f'Заметка {number} про <b>лес</b>')
+            for number in range(12)
+        ])
+        best = Post.objects.create(author=self.author, text='лес лес лес')
+        Post.objects.create(author=self.author, text='Про поле')
+        url = reverse('posts:search')
+        response = self.client.get(url, {'q': 'лес'})
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj[0].pk, best.pk)
+        self.assertEqual(len(page_obj), 10)
+        self.assertIn('&lt;b&gt;<mark>лес</mark>&lt;/b&gt;',
+                      response.content.decode())
+        self.assertContains(response, '?q=%D0%BB%D0%B5%D1%81&amp;after=')
+
+        response = self.client.get(url, {'q': 'лес',
+                                         'after': page_obj.next_cursor})
+        second = response.context['page_obj']
+        self.assertEqual(len(second), 3)
+        self.assertIsNone(second.next_cursor)
+        seen = {post.pk for post in page_obj} | {post.pk for post in second}
+        self.assertEqual(len(seen), 13)
+
+    def test_admin_search_uses_index(self):
+        post = Post.objects.create(author=self.author, text='Горное озеро')
+        Post.objects.create(author=self.author, text='Морской берег')
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('admin:posts_post_changelist'),
+                                   {'q': 'озер'})
+        self.assertEqual(
+            [obj.pk for obj in response.context['cl'].result_list],
+            [post.pk])
@@ -0,0 +1,138 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from .. import storage, thumbnails
+from ..models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@mock.patch('posts.storage.transaction.on_commit',
+            side_effect=lambda callback: callback())
+class ContentAddressedStorageTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, name='small.gif'):
+        return Post.objects.create(
+            author=self.author,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(name, SMALL_GIF, 'image/gif'),
+        )
+
+    def test_same_upload_stored_once(self, on_commit):
+        """Одинаковые загрузки хранятся одним файлом с общими
+        миниатюрами."""
+        first = self.create_post('first.gif')
+        second = self.create_post('second.gif')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(storage.is_content_name(first.image.name))
+        thumbnails.generate(first.pk)
+        self.assertEqual(thumbnails.cached_picture(second).url,
+                         thumbnails.cached_picture(first).url)
+
+    def test_file_deleted_with_last_reference(self, on_commit):
+        """Файл удаляется, только когда его не использует ни один пост."""
+        first = self.create_post()
+        second = self.create_post()
+        name = first.image.name
+        first.delete()
+        self.assertTrue(storage.content_storage.exists(name))
+        second.image = None
+        second.save()
+        self.assertFalse(storage.content_storage.exists(name))
+
+    def test_reused_file_restored_after_concurrent_delete(self, on_commit):
+        """Файл, на который сослался новый пост, возвращается на место,
+        если его удалил запрос, ещё не видевший этого поста."""
+        first = self.create_post()
+        name = first.image.name
+        callbacks = []
+        on_commit.side_effect = callbacks.append
+        second = self.create_post()
+        self.assertEqual(second.image.name, name)
+        # другой запрос не видит второго поста и удаляет файл
+        with mock.patch('posts.storage.references', return_value=0):
+            self.assertTrue(storage.delete_if_unused(name))
+        self.assertFalse(storage.content_storage.exists(name))
+        for callback in callbacks:
+            callback()
+        with storage.content_storage.open(name) as file:
+            self.assertEqual(file.read(), SMALL_GIF)
+
+    def test_concurrent_first_uploads_share_content_name(self, on_commit):
+        """Если файл записал параллельный запрос между проверкой и
+        записью, загрузка ссылается на него, а не на копию с суффиксом."""
+        name = self.create_post().image.name
+        real_exists = storage.content_storage.exists
+        # первая проверка ещё не видит файла другого запроса
+        with mock.patch.object(storage.content_storage, 'exists',
+                               side_effect=[False, True, True]):
+            second = self.create_post()
+        self.assertEqual(second.image.name, name)
+        directory = os.path.dirname(storage.content_storage.path(name))
+        self.assertEqual(os.listdir(directory), [os.path.basename(name)])
+        self.assertTrue(real_exists(name))
+
+    def test_lock_is_not_taken_over_or_released_by_others(self, on_commit):
+        """Занятая блокировка не отбирается по таймауту и не снимается
+        чужим владельцем; удаление в это время откладывается."""
+        name = self.create_post().image.name
+        key = f'storage:lock:{name}'
+        cache.set(key, 'other', None)
+        self.addCleanup(cache.delete, key)
+        with mock.patch('posts.storage.LOCK_TIMEOUT', 0.1):
+            with self.assertRaises(storage.LockTimeout):
+                with storage.locked(name):
+                    pass
+            with mock.patch('posts.storage.references', return_value=0):
+                self.assertFalse(storage.delete_if_unused(name))
+        self.assertEqual(cache.get(key), 'other')
+        self.assertTrue(storage.content_storage.exists(name))
+
+    def test_dedupe_images_command(self, on_commit):
+        """Команда переносит старые копии под общее имя по хешу."""
+        names = ['posts/image.gif', 'posts/image_04unO8S.gif']
+        os.makedirs(os.path.join(TEMP_MEDIA_ROOT, 'posts'), exist_ok=True)
+        for name in names:
+            with open(os.path.join(TEMP_MEDIA_ROOT, name), 'wb') as file:
+                file.write(SMALL_GIF)
+            Post.objects.create(author=self.author, text='Старый пост',
+                                image=name)
+        out = StringIO()
+        call_command('dedupe_images', stdout=out)
+        images = set(Post.objects.filter(text='Старый пост')
+                     .values_list('image', flat=True))
+        self.assertEqual(len(images), 1)
+        self.assertTrue(storage.is_content_name(images.pop()))
+        for name in names:
+            self.assertFalse(storage.content_storage.exists(name))
+        self.assertIn('удалено копий: 2', out.getvalue())
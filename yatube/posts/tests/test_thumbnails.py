@@ -0,0 +1,147 @@
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+
+from .. import thumbnails
+from ..kvstore import LRUKVStore
+from ..models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        default.kvstore.forget_all()
+        self.client = Client()
+        self.client.force_login(self.author)
+
+    def create_post(self):
+        return Post.objects.create(
+            author=self.author,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile('small.gif', SMALL_GIF, 'image/gif'),
+        )
+
+    @override_settings(THUMBNAIL_BACKGROUND=True)
+    @mock.patch('posts.thumbnails.enqueue')
+    def test_placeholder_until_thumbnail_is_ready(self, enqueue):
+        """Пока миниатюры нет, страница показывает заглушку и не строит её
+        сама, а после фонового построения — картинку."""
+        post = self.create_post()
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'bg-light')
+        self.assertIsNone(thumbnails.cached_picture(post))
+        enqueue.assert_called_with(post.pk)
+        thumbnails.generate(post.pk)
+        thumbnail = thumbnails.cached_picture(post)
+        self.assertIsNotNone(thumbnail)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, thumbnail.url)
+
+    def test_picture_lists_every_width(self):
+        """Картинка поста отдаётся с srcset из всех ширин профиля."""
+        post = self.create_post()
+        thumbnails.generate(post.pk)
+        picture = thumbnails.cached_picture(post)
+        profile = thumbnails.PROFILES['card']
+        self.assertEqual(picture.srcset.count('w,') + 1, len(profile.widths))
+        self.assertEqual(len(picture.sources),
+                         len(thumbnails.modern_formats()))
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        self.assertContains(response, f'srcset="{picture.srcset}"')
+
+    def test_page_pictures_loaded_in_one_query(self):
+        """Миниатюры всех постов страницы читаются из хранилища sorl одним
+        запросом, а повторно — из LRU процесса без запросов."""
+        posts = [self.create_post() for _ in range(3)]
+        for post in posts:
+            thumbnails.generate(post.pk)
+        cache.clear()
+        default.kvstore.forget_all()
+        with CaptureQueriesContext(connection) as queries:
+            thumbnails.preload_pictures(posts)
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(all(post.pictures['card'] for post in posts))
+        cache.clear()
+        with self.assertNumQueries(0):
+            thumbnails.preload_pictures(posts)
+        self.assertTrue(all(post.pictures['card'] for post in posts))
+
+    def test_lru_entries_expire(self):
+        """Миниатюру, удалённую другим процессом, LRU помнит не дольше
+        THUMBNAIL_LRU_TIMEOUT, а потом читает хранилище заново."""
+        post_id = self.create_post().pk
+        thumbnails.generate(post_id)
+
+        def picture():
+            return thumbnails.cached_picture(Post.objects.get(pk=post_id))
+
+        self.assertIsNotNone(picture())
+        other_process = LRUKVStore()
+        for key in default.kvstore._find_keys_raw(
+                sorl_settings.THUMBNAIL_KEY_PREFIX):
+            other_process._delete_raw(key)
+        self.assertIsNotNone(picture())
+        expired = time.monotonic() + settings.THUMBNAIL_LRU_TIMEOUT
+        with mock.patch('posts.kvstore.time.monotonic',
+                        return_value=expired):
+            self.assertIsNone(picture())
+
+    @mock.patch('posts.thumbnails.modern_formats', return_value=['WEBP'])
+    def test_modern_formats_get_own_variants(self, modern_formats):
+        """Для каждого доступного современного формата строится свой набор
+        ширин."""
+        profile = thumbnails.PROFILES['card']
+        formats = [format_ for format_, _, _, options in profile.variants()]
+        self.assertEqual(formats.count('WEBP'), len(profile.widths))
+        self.assertEqual(formats.count(None), len(profile.widths))
+        self.assertEqual(profile.geometry(480), '480x170')
+
+    @mock.patch('posts.thumbnails.enqueue')
+    @mock.patch('posts.thumbnails.transaction.on_commit',
+                side_effect=lambda callback: callback())
+    def test_create_schedules_generation(self, on_commit, enqueue):
+        """После создания поста с картинкой построение ставится в очередь
+        по фиксации транзакции."""
+        self.client.post(reverse('posts:post_create'), data={
+            'text': 'Новый пост',
+            'image': SimpleUploadedFile('new.gif', SMALL_GIF, 'image/gif'),
+        })
+        post = Post.objects.get(text='Новый пост')
+        on_commit.assert_called_once()
+        enqueue.assert_called_once_with(post.pk)
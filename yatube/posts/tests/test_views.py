@@ -1,6 +1,7 @@
 # post/tests/test_views.py
 import tempfile
 import shutil
+from http import HTTPStatus
 
 from django import forms
 from django.conf import settings
@@ -9,9 +10,11 @@ from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from ..forms import PostForm
-from ..models import Group, Post, User, Comment
+from ..models import Comment, Follow, Group, Post, User
 
 User = get_user_model()
 ITEMS_PER_PAGE = 10
@@ -271,15 +274,16 @@ class PostViewsTest(TestCase):
         self.assertFalse(Post.objects.filter(text='Комментарий', ).exists())
 
     def test_cache_on_index_page_works_correct(self):
-        """Кэширование данных на главной странице работает корректно."""
+        """Главная страница берётся из кеша, пока посты не менялись, и
+        обновляется сразу после удаления поста."""
         response = self.authorized_client.get(reverse('posts:index'))
         cached_content = response.content
-        Post.objects.all().delete()
+        # update() не шлёт сигналов, поэтому кеш остаётся прежним
+        Post.objects.update(text='Изменённый текст')
         response = self.authorized_client.get(reverse('posts:index'))
-        cached_content_after_delete = response.content
         self.assertEqual(
             cached_content,
-            cached_content_after_delete,
+            response.content,
             'Кэширование работает некорректно.'
         )
         cache.clear()
@@ -289,6 +293,88 @@ class PostViewsTest(TestCase):
             response.content,
             'Кэширование после очистки работает некорректно'
         )
+        cached_content = response.content
+        Post.objects.all().delete()
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertNotEqual(
+            cached_content,
+            response.content,
+            'Удаление поста не сбросило кеш главной страницы'
+        )
+
+    def test_tagged_cache_invalidated_by_related_changes(self):
+        """Комментарии не сбрасывают кеш ленты, а новый пост в группе
+        сразу виден на странице группы."""
+        group_url = reverse('posts:group_list',
+                            kwargs={'slug': self.group.slug})
+        content = self.guest_client.get(group_url).content
+        Comment.objects.create(post=self.post, author=self.author,
+                               text='Ещё комментарий')
+        self.assertEqual(self.guest_client.get(group_url).content, content)
+        Post.objects.create(author=self.author, group=self.group,
+                            text='Свежий пост группы')
+        self.assertIn('Свежий пост группы',
+                      self.guest_client.get(group_url).content.decode())
+
+    def test_post_card_fragment_shared_between_feeds(self):
+        """Разметка карточки кешируется одна на все ленты, а ссылка на
+        редактирование зависит от посетителя."""
+        self.guest_client.get(reverse('posts:index'))
+        # update() не шлёт сигналов: версия карточки остаётся прежней
+        Post.objects.filter(pk=self.post.pk).update(text='Новый текст')
+        group_url = reverse('posts:group_list',
+                            kwargs={'slug': self.group.slug})
+        content = self.guest_client.get(group_url).content.decode()
+        self.assertIn(self.post.text, content)
+        self.assertNotIn('Новый текст', content)
+        edit_url = reverse('posts:post_edit', kwargs={'post_id': self.post.id})
+        self.assertNotIn(edit_url, content)
+        content = self.authorized_client_author.get(
+            group_url).content.decode()
+        self.assertIn(edit_url, content)
+        post = Post.objects.get(pk=self.post.pk)
+        post.save()
+        content = self.guest_client.get(group_url).content.decode()
+        self.assertIn('Новый текст', content)
+
+    def test_author_rename_refreshes_cached_feeds(self):
+        """Правка автора сразу видна в кешированных лентах с его постами."""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+        ]
+        for url in urls:
+            self.guest_client.get(url)
+        author = User.objects.get(pk=self.author.pk)
+        author.first_name = 'Переименованный'
+        author.save()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.guest_client.get(url),
+                                    'Переименованный')
+
+    def test_group_rename_and_delete_expire_cached_pages(self):
+        """Старый адрес переименованной группы и страница удалённой
+        группы не отдаются из кеша."""
+        group = Group.objects.create(title='Группа', slug='old-slug')
+        Post.objects.create(author=self.author, group=group, text='Текст')
+        old_url = reverse('posts:group_list', kwargs={'slug': 'old-slug'})
+        self.assertEqual(self.guest_client.get(old_url).status_code,
+                         HTTPStatus.OK)
+        self.assertContains(self.guest_client.get(reverse('posts:index')),
+                            old_url)
+        group.slug = 'new-slug'
+        group.save()
+        self.assertEqual(self.guest_client.get(old_url).status_code,
+                         HTTPStatus.NOT_FOUND)
+        self.assertNotContains(
+            self.guest_client.get(reverse('posts:index')), old_url)
+        new_url = reverse('posts:group_list', kwargs={'slug': 'new-slug'})
+        self.assertEqual(self.guest_client.get(new_url).status_code,
+                         HTTPStatus.OK)
+        group.delete()
+        self.assertEqual(self.guest_client.get(new_url).status_code,
+                         HTTPStatus.NOT_FOUND)
 
 
 class PaginatorViewsTest(TestCase):
@@ -339,3 +425,125 @@ class PaginatorViewsTest(TestCase):
         response = self.client.get(reverse(
             'posts:profile', kwargs={'username': self.author.username}))
         self.assertEqual(len(response.context['page_obj']), ITEMS_PER_PAGE)
+
+    def test_cursor_pages_cover_all_posts(self):
+        """Листание по курсору вперёд и назад не теряет и не дублирует
+        посты."""
+        response = self.client.get(reverse('posts:index'))
+        first_page = response.context['page_obj']
+        self.assertIsNone(first_page.previous_cursor)
+        self.assertIsNotNone(first_page.next_cursor)
+        response = self.client.get(
+            reverse('posts:index'), {'after': first_page.next_cursor})
+        second_page = response.context['page_obj']
+        self.assertEqual(len(second_page), ITEMS_PER_PAGE_3)
+        self.assertIsNone(second_page.next_cursor)
+        ids = [post.id for post in first_page] + [
+            post.id for post in second_page]
+        self.assertEqual(
+            ids, list(Post.objects.order_by('-pub_date', '-id')
+                      .values_list('id', flat=True)))
+        response = self.client.get(
+            reverse('posts:index'), {'before': second_page.previous_cursor})
+        self.assertEqual(list(response.context['page_obj']), list(first_page))
+        self.assertIsNone(response.context['page_obj'].previous_cursor)
+
+    def test_cursor_page_does_not_count_posts(self):
+        """Страница по курсору не выполняет COUNT(*)."""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('posts:group_list',
+                                    kwargs={'slug': 'test-slug'}))
+        self.assertFalse(
+            any('COUNT(' in query['sql'] for query in queries.captured_queries)
+        )
+
+    def test_numbered_pages_use_maintained_or_cached_count(self):
+        """Нумерованные страницы берут число постов из счётчика группы, а
+        для главной считают его раз в PAGINATOR_COUNT_TIMEOUT."""
+        # посты созданы через bulk_create, счётчик выставляем вручную
+        Group.objects.filter(pk=self.group.pk).update(posts_count=13)
+        url = reverse('posts:group_list', kwargs={'slug': 'test-slug'})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'page': 2})
+        self.assertEqual(len(response.context['page_obj']), ITEMS_PER_PAGE_3)
+        self.assertFalse(
+            any('COUNT(' in query['sql'] for query in queries.captured_queries)
+        )
+        response = self.client.get(reverse('posts:index'), {'page': 2})
+        self.assertFalse(response.context['paginator'].approximate)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('posts:index'), {'page': 1})
+        self.assertFalse(
+            any('COUNT(' in query['sql'] for query in queries.captured_queries)
+        )
+        self.assertTrue(response.context['paginator'].approximate)
+        self.assertContains(response, 'примерно')
+
+    def test_broken_cursor_returns_first_page(self):
+        """Испорченный курсор приводит на первую страницу."""
+        response = self.client.get(reverse('posts:index'), {'after': '%%%'})
+        self.assertEqual(len(response.context['page_obj']), ITEMS_PER_PAGE)
+        self.assertIsNone(response.context['page_obj'].previous_cursor)
+
+
+class QueryBudgetTest(TestCase):
+    """Число запросов страницы не зависит от числа постов и комментариев:
+    авторы, группы и авторы комментариев загружаются пачкой."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='test-slug',
+            description='Тестовый текст',
+        )
+        authors = [User.objects.create_user(username=f'author_{number}')
+                   for number in range(ITEMS_PER_PAGE)]
+        for author in authors:
+            Follow.objects.create(user=cls.reader, author=author)
+        cls.posts = [
+            Post.objects.create(author=author, group=cls.group, text='Текст')
+            for author in authors
+        ]
+        cls.post = cls.posts[0]
+        for author in authors:
+            Comment.objects.create(post=cls.post, author=author,
+                                   text='Комментарий')
+        cls.author = cls.post.author
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_guest_pages_query_budget(self):
+        """Страницы для гостя укладываются в бюджет запросов."""
+        budgets = {
+            reverse('posts:index'): 1,
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}): 2,
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}): 2,
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}): 2,
+        }
+        for url, budget in budgets.items():
+            with self.subTest(url=url):
+                with self.assertNumQueries(budget):
+                    self.client.get(url)
+
+    def test_authorized_pages_query_budget(self):
+        """Страницы для авторизованного пользователя укладываются в бюджет
+        запросов (два из них — сессия и пользователь)."""
+        budgets = {
+            (self.reader_client, reverse('posts:follow_index')): 4,
+            (self.authorized_client,
+             reverse('posts:post_edit', kwargs={'post_id': self.post.id})): 4,
+            (self.authorized_client, reverse('posts:post_create')): 3,
+        }
+        for (client, url), budget in budgets.items():
+            with self.subTest(url=url):
+                with self.assertNumQueries(budget):
+                    client.get(url)
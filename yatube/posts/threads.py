@@ -0,0 +1,86 @@
+""" Ветки комментариев на материализованном пути.
+
+Путь комментария — id его предков и его собственный, дополненные нулями
+до одной ширины. Поэтому пути сравниваются как строки в порядке обхода
+ветки в глубину, а ветка целиком — диапазон путей от пути корня до пути
+корня с ``RANGE_END`` на конце: ``RANGE_END`` идёт сразу за разделителем,
+но раньше любой цифры. Страница веток и поддерево читаются одним запросом
+по индексу ``(post, path)``, без рекурсии по ответам.
+"""
+from django.db.models import Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import PATH_SEGMENT, PATH_SEPARATOR, Comment
+
+RANGE_END = chr(ord(PATH_SEPARATOR) + 1)
+
+
+def root_path(pk):
+    """ Путь корня ветки с id ``pk`` """
+    return f'{pk:0{PATH_SEGMENT}d}'
+
+
+def subtree(comment):
+    """ Комментарий и все ответы на него в порядке обхода ветки """
+    return Comment.objects.filter(
+        post_id=comment.post_id,
+        path__gte=comment.path,
+        path__lt=comment.path + RANGE_END,
+    ).order_by('path')
+
+
+class ThreadPage:
+    """ Порция веток: комментарии подряд, новые ветки сверху.
+
+    ``next_cursor`` — id самого старого корня порции, если ветки старше
+    него ещё есть.
+    """
+
+    def __init__(self, object_list, next_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+
+def threads_page(post, per_page, after=None):
+    """ ``per_page`` самых новых веток поста старше корня ``after``.
+
+    Нижняя граница диапазона — путь ``per_page``-го корня, а есть ли
+    ветки дальше, показывает путь следующего; оба находятся подзапросами
+    по индексу ``(post, parent, path)`` в том же запросе.
+    """
+    comments = post.comments.select_related('author')
+    roots = post.comments.filter(parent__isnull=True)
+    if after is not None and str(after).isdigit():
+        upper = root_path(int(after))
+        comments = comments.filter(path__lt=upper)
+        roots = roots.filter(path__lt=upper)
+    roots = roots.order_by('-path').values('path')
+    rows = (comments
+            # корней меньше per_page: берём все ветки до курсора
+            .filter(path__gte=Coalesce(
+                Subquery(roots[per_page - 1:per_page]), Value('')))
+            .annotate(next_root=Subquery(roots[per_page:per_page + 1]))
+            .order_by('path'))
+    threads = []
+    for comment in rows:
+        if comment.parent_id is None:
+            threads.append([])
+        if threads:
+            threads[-1].append(comment)
+    if not threads:
+        return ThreadPage([])
+    threads.reverse()
+    next_cursor = None
+    if rows[0].next_root is not None:
+        next_cursor = threads[-1][0].pk
+    return ThreadPage([comment for thread in threads for comment in thread],
+                      next_cursor)
@@ -0,0 +1,231 @@
+""" Миниатюры картинок постов.
+
+Миниатюры строятся в фоновом пуле потоков сразу после сохранения поста,
+а шаблоны только ищут готовую миниатюру в хранилище sorl-thumbnail и
+до её появления показывают заглушку, не задерживая ответ.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import connection, transaction
+from PIL import Image
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import EXTENSIONS, ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+# современные форматы в порядке предпочтения и их MIME-типы
+MODERN_FORMATS = {'AVIF': 'image/avif', 'WEBP': 'image/webp'}
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+class PostThumbnailBackend(ThumbnailBackend):
+    """ Бэкенд sorl-thumbnail, умеющий назвать миниатюру без построения """
+
+    def thumbnail_file(self, file_, geometry_string, options):
+        """ Файл миниатюры с тем же именем, что даст get_thumbnail """
+        source = ImageFile(file_)
+        options = dict(options)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+
+def modern_formats():
+    """ Современные форматы, которые умеют записывать Pillow и sorl """
+    Image.init()
+    return [format_ for format_ in MODERN_FORMATS
+            if format_ in Image.SAVE and format_ in EXTENSIONS]
+
+
+class ThumbnailProfile:
+    """ Набор миниатюр для одного места на странице.
+
+    Миниатюры строятся в нескольких ширинах с общими пропорциями: в
+    формате по умолчанию (THUMBNAIL_FORMAT) и в современных форматах,
+    если их поддерживает установленный Pillow.
+    """
+
+    def __init__(self, name, width, height, widths, sizes, **options):
+        self.name = name
+        self.width = width
+        self.height = height
+        self.widths = sorted(set(widths) | {width})
+        self.sizes = sizes
+        self.options = options
+
+    def geometry(self, width):
+        return f'{width}x{round(width * self.height / self.width)}'
+
+    def variants(self):
+        """ Формат (None — по умолчанию), ширина, геометрия и настройки """
+        for format_ in [None, *modern_formats()]:
+            options = dict(self.options)
+            if format_ is not None:
+                options['format'] = format_
+            for width in self.widths:
+                yield format_, width, self.geometry(width), options
+
+
+class Picture:
+    """ Готовые миниатюры профиля для тегов <picture> и <img srcset> """
+
+    def __init__(self, profile, thumbnails):
+        self.profile = profile
+        self.thumbnails = thumbnails
+        fallback = thumbnails[None, profile.width]
+        self.url = fallback.url
+        self.width = fallback.width
+        self.height = fallback.height
+        self.sizes = profile.sizes
+        self.srcset = self._srcset(None)
+        self.sources = [
+            {'type': MODERN_FORMATS[format_], 'srcset': self._srcset(format_)}
+            for format_ in modern_formats()
+        ]
+
+    def _srcset(self, format_):
+        return ', '.join(
+            f'{self.thumbnails[format_, width].url} {width}w'
+            for width in self.profile.widths
+        )
+
+
+PROFILES = {}
+
+
+def register_profile(profile):
+    PROFILES[profile.name] = profile
+    return profile
+
+
+# карточка поста в лентах и картинка на странице поста
+register_profile(ThumbnailProfile(
+    'card', 960, 339,
+    widths=(480, 960, 1440),
+    sizes='(max-width: 992px) 100vw, 960px',
+    crop='center',
+    upscale=True,
+))
+
+
+def preload_pictures(posts, profile='card'):
+    """ Проставляет постам готовые миниатюры профиля.
+
+    Метаданные миниатюр всей страницы читаются из хранилища sorl одним
+    ``get_many_raw``. Пост, у которого построены не все миниатюры,
+    получает None.
+    """
+    posts = list(posts)
+    profile = PROFILES[profile]
+    files = {
+        post.pk: {
+            (format_, width): default.backend.thumbnail_file(
+                post.image, geometry, options)
+            for format_, width, geometry, options in profile.variants()
+        }
+        for post in posts if post.image
+    }
+    found = default.kvstore.get_many_raw(
+        add_prefix(thumbnail.key)
+        for variants in files.values() for thumbnail in variants.values()
+    )
+    for post in posts:
+        picture = None
+        keys = {variant: add_prefix(thumbnail.key)
+                for variant, thumbnail in files.get(post.pk, {}).items()}
+        if keys and all(key in found for key in keys.values()):
+            picture = Picture(profile, {
+                variant: deserialize_image_file(found[key])
+                for variant, key in keys.items()
+            })
+        if not hasattr(post, 'pictures'):
+            post.pictures = {}
+        post.pictures[profile.name] = picture
+    return posts
+
+
+def cached_picture(post, profile='card'):
+    """ Миниатюры поста по профилю, если все они уже построены """
+    pictures = getattr(post, 'pictures', {})
+    if pictures.get(profile) is None:
+        preload_pictures([post], profile)
+    return post.pictures[profile]
+
+
+def build(post):
+    """ Строит миниатюры поста по всем профилям """
+    for profile in PROFILES.values():
+        for _, _, geometry, options in profile.variants():
+            get_thumbnail(post.image, geometry, **options)
+
+
+def generate(post_id):
+    """ Строит миниатюры поста и сбрасывает кеш страниц с заглушкой """
+    from .signals import bump_post_tags
+
+    post = Post.objects.select_related('author').filter(pk=post_id).first()
+    if post is None or not post.image:
+        return
+    build(post)
+    bump_post_tags(post)
+
+
+def _run(post_id):
+    try:
+        generate(post_id)
+    except Exception:
+        logger.exception('Не удалось построить миниатюры поста %s', post_id)
+    finally:
+        with _lock:
+            _pending.discard(post_id)
+        # у каждого потока пула своё соединение с базой
+        connection.close()
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+    return _executor
+
+
+def enqueue(post_id):
+    """ Ставит построение миниатюр в очередь, если его ещё нет в очереди """
+    if not settings.THUMBNAIL_BACKGROUND:
+        generate(post_id)
+        return
+    with _lock:
+        if post_id in _pending:
+            return
+        _pending.add(post_id)
+    _get_executor().submit(_run, post_id)
+
+
+def schedule(post):
+    """ Построить миниатюры после фиксации транзакции с постом """
+    if post.image:
+        transaction.on_commit(partial(enqueue, post.pk))
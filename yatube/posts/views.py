@@ -1,89 +1,158 @@
+import codecs
+
 from django.shortcuts import get_object_or_404, render, redirect
-from django.core.paginator import Paginator
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
+from django.db import transaction
+from django.http import JsonResponse
+from django.views.decorators.http import require_POST
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from core.cache import cache_page_tagged, tags_version
 
-from .models import Group, Post, User, Follow
+from .models import Group, Post, User
 from .forms import PostForm, CommentForm
+from .cache_tags import (group_tags, index_tags, profile_tags,
+                         with_card_versions)
+from . import autocomplete, follow_graph, follows, thumbnails
+from .counters import stats_for
+from .feed import FollowFeed, FollowFeedPaginator
+from .paginator import CursorPaginator
+from .search import SearchPaginator, highlight, search_posts
+from .threads import threads_page
 
 PAGE_POSTS = 10
+# веток комментариев на странице поста и в каждой подгружаемой порции
+PAGE_COMMENTS = 20
+# ключи кеша для числа постов в лентах без поддерживаемого счётчика
+INDEX_COUNT_KEY = 'count:index'
+FOLLOW_COUNT_KEY = 'count:follow:'
+# сколько подписок из запроса вставлять в одной транзакции
+FOLLOW_BATCH_SIZE = 1000
 
 
-def pagination(request, queryset):
-    paginator = Paginator(queryset, PAGE_POSTS)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+def pagination(request, queryset, paginator_class=CursorPaginator,
+               **options):
+    """ Страница ленты: по курсору ?after=/?before= или по номеру ?page= """
+    paginator = paginator_class(queryset, PAGE_POSTS, **options)
+    page_obj = paginator.get_request_page(request.GET)
+    page_obj.object_list = thumbnails.preload_pictures(
+        with_card_versions(page_obj.object_list, request))
     return {
         'paginator': paginator,
-        'page_namber': page_number,
         'page_obj': page_obj,
     }
 
 
-@cache_page(20, key_prefix='index_page', )
+@cache_page_tagged(index_tags)
 def index(request):
     """ Главная страница """
-    posts = Post.objects.all()
-    paginator = Paginator(posts, PAGE_POSTS)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    posts = Post.objects.select_related('author', 'group')
     template = 'posts/index.html'
     context = {
-        'page_obj': page_obj,
-        'posts': posts,
         'title': 'Последние обновления на сайте',
+        **pagination(request, posts, count_key=INDEX_COUNT_KEY),
     }
+    # фрагмент устаревает и с правкой любой из его карточек
+    context['cache_version'] = ':'.join([
+        tags_version(index_tags(request)),
+        *(post.card_version for post in context['page_obj']),
+    ])
     return render(request, template, context)
 
 
+@cache_page_tagged(group_tags)
 def group_posts(request, slug):
     """ Посты в группе """
     template = 'posts/group_list.html'
     group = get_object_or_404(Group, slug=slug)
-    posts = group.g_posts.all()
-    paginator = Paginator(posts, PAGE_POSTS)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    posts = group.g_posts.select_related('author', 'group')
     context = {
-        "page_obj": page_obj,
         'group': group,
-        'posts': posts,
         'title': slug,
+        **pagination(request, posts, count=group.posts_count),
     }
     return render(request, template, context)
 
 
+@cache_page_tagged(profile_tags)
 def profile(request, username):
     """ профайл автора """
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
-    count = author.posts.count()
-    paginator = Paginator(posts, PAGE_POSTS)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
-    following = False
-    if request.user.is_authenticated:
-        following = Follow.objects.filter(user=request.user,
-                                          author=author).exists()
+    author = get_object_or_404(User.objects.select_related('stats'),
+                               username=username)
+    posts = author.posts.select_related('author', 'group')
+    stats = stats_for(author)
+    following = follow_graph.is_following(request.user.pk, author.pk)
     context = {
-        "page_obj": page_obj,
-        "count": count,
+        "count": stats.posts_count,
+        "stats": stats,
         "author": author,
         "following": following,
+        "mutual": following and follow_graph.is_following(
+            author.pk, request.user.pk),
+        **pagination(request, posts, count=stats.posts_count),
     }
     template = "posts/profile.html"
     return render(request, template, context)
 
 
+def search(request):
+    """ Поиск по текстам постов, самые релевантные сверху """
+    query = request.GET.get('q', '').strip()
+    posts = search_posts(Post.objects.select_related('author', 'group'),
+                         query)
+    context = {
+        'query': query,
+        # ссылки паджинатора сохраняют запрос
+        'page_query': f"{urlencode({'q': query})}&",
+        **pagination(request, posts, paginator_class=SearchPaginator),
+    }
+    for post in context['page_obj']:
+        post.highlight = highlight(post.snippet)
+    return render(request, 'posts/search.html', context)
+
+
+def suggest(request):
+    """ Подсказки авторов и групп по началу имени, без запросов к базе """
+    kind = request.GET.get('kind')
+    if kind not in (autocomplete.USER, autocomplete.GROUP):
+        kind = None
+    try:
+        limit = int(request.GET.get('limit', autocomplete.LIMIT))
+    except ValueError:
+        limit = autocomplete.LIMIT
+    results = []
+    for found, data in autocomplete.suggest(request.GET.get('q', ''), kind,
+                                            limit):
+        if found == autocomplete.USER:
+            url = reverse('posts:profile', args=(data['username'],))
+        else:
+            url = reverse('posts:group_list', args=(data['slug'],))
+        results.append({'kind': found, 'url': url, **data})
+    return JsonResponse({'results': results})
+
+
+def comments_page(post, after=None):
+    """ Порция веток комментариев поста, новые ветки сверху.
+
+    Ветки вместе с ответами читаются одним запросом по материализованному
+    пути, число комментариев берётся из счётчика поста.
+    """
+    return threads_page(post, PAGE_COMMENTS, after)
+
+
 def post_detail(request, post_id):
     """ пост подробно """
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), pk=post_id)
     form = CommentForm()
-    comments = post.comments.all()
+    # без JavaScript кнопка «Показать ещё» ведёт сюда же с курсором
+    comments = comments_page(post, request.GET.get('comments_after'))
+    # «Ответить» открывает форму с id комментария, на который отвечают
+    reply_to = request.GET.get('reply_to', '')
     post_title = post.text
-    count = post.author.posts.count()
     author = post.author
-    author_posts = author.posts.all().count()
+    count = author_posts = stats_for(author).posts_count
     template = "posts/post_detail.html"
     context = {
         "post": post,
@@ -92,11 +161,22 @@ def post_detail(request, post_id):
         "author_posts": author_posts,
         "form": form,
         "comments": comments,
+        "reply_to": reply_to if reply_to.isdigit() else None,
         "count": count,
     }
     return render(request, template, context)
 
 
+def post_comments(request, post_id):
+    """ следующая порция комментариев — фрагмент HTML для подгрузки """
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    context = {
+        'post': post,
+        'comments': comments_page(post, request.GET.get('after')),
+    }
+    return render(request, 'includes/comment_list.html', context)
+
+
 @login_required
 def post_create(request):
     """ создание нового поста """
@@ -108,7 +188,10 @@ def post_create(request):
         if form.is_valid():
             post = form.save(commit=False)
             post.author = request.user
-            post.save()
+            # счётчики и лента обновляются в той же транзакции
+            with transaction.atomic():
+                post.save()
+                thumbnails.schedule(post)
             return redirect('posts:profile', post.author)
     groups = Group.objects.all()
     template = "posts/create_post.html"
@@ -120,7 +203,8 @@ def post_create(request):
 def post_edit(request, post_id):
     """ редактирование поста """
     is_edit = True
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(Post.objects.select_related('author'),
+                             pk=post_id)
     author = post.author
     groups = Group.objects.all()
     if request.user != author:
@@ -131,7 +215,10 @@ def post_edit(request, post_id):
         files=request.FILES or None,
     )
     if request.method == "POST" and form.is_valid():
-        form.save()
+        with transaction.atomic():
+            post = form.save()
+            if 'image' in form.changed_data:
+                thumbnails.schedule(post)
         return redirect("posts:post_detail", post_id)
     template = "posts/create_post.html"
     context = {
@@ -152,15 +239,21 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        parent_id = request.POST.get('parent', '')
+        if parent_id.isdigit():
+            # отвечать можно только на комментарий того же поста
+            comment.parent = post.comments.filter(pk=parent_id).first()
+        with transaction.atomic():
+            comment.save()
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
 def follow_index(request):
     """ Главная страница с постами авторов на кого подписался"""
-    post_list = Post.objects.filter(author__following__user=request.user)
-    context = pagination(request, post_list)
+    context = pagination(request, FollowFeed(request.user),
+                         paginator_class=FollowFeedPaginator,
+                         count_key=f'{FOLLOW_COUNT_KEY}{request.user.pk}')
     template = 'posts/follow.html'
     return render(request, template, context)
 
@@ -171,13 +264,33 @@ def profile_follow(request, username):
     user = request.user
     author = get_object_or_404(User, username=username)
     if author != user:
-        Follow.objects.get_or_create(user=user, author=author)
+        follows.follow(user, author)
     return redirect('posts:profile', username=username)
 
 
 @login_required
 def profile_unfollow(request, username):
     """ отписаться от автора """
-    Follow.objects.filter(user=request.user,
-                          author__username=username).delete()
+    author = get_object_or_404(User, username=username)
+    follows.unfollow(request.user, author)
     return redirect('posts:profile', username=username)
+
+
+@login_required
+@require_POST
+def follow_batch(request):
+    """ Пакетная подписка: тело запроса — CSV (user,author) или NDJSON.
+
+    Обычный пользователь подписывает только себя, персонал — кого угодно.
+    """
+    format_ = 'ndjson' if 'ndjson' in request.content_type else 'csv'
+    read = follows.READERS[format_]
+    # тело читается построчно, а не загружается в память целиком
+    lines = codecs.iterdecode(request, request.encoding or 'utf-8')
+    owner = None if request.user.is_staff else request.user
+    try:
+        stats = follows.import_follows(read(lines), FOLLOW_BATCH_SIZE,
+                                       owner=owner)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    return JsonResponse(stats)
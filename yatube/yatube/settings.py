@@ -136,6 +136,11 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
+# сюда collectstatic складывает файлы с хешем в имени и их сжатые копии
+STATIC_ROOT = os.path.join(BASE_DIR, 'collected_static')
+STATICFILES_STORAGE = 'core.staticfiles.CompressedManifestStaticFilesStorage'
+# сколько кешировать статику без хеша в имени, в секундах
+STATIC_MAX_AGE = 60 * 60
 
 # Это адрес, на который Django будет перенаправлять пользователей для
 # авторизации. Это особенно важно при использовании декоратора @login_required
@@ -159,12 +164,82 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 # полный путь к директории, куда будут загружаться файлы пользователей
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
-
-# подключение кеширования бэкенда
+# файлы с этими путями не меняются без смены имени: миниатюры sorl и
+# картинки постов, названные по хешу содержимого
+MEDIA_IMMUTABLE_PATTERNS = [
+    r'^cache/',
+    r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.\w+$',
+]
+# сколько кешировать остальные файлы из MEDIA_ROOT, в секундах
+MEDIA_MAX_AGE = 60 * 60
+# отдачу байтов можно поручить веб-серверу: nginx — префикс internal
+# location для X-Accel-Redirect, Apache/lighttpd — X-Sendfile
+MEDIA_ACCEL_REDIRECT = ''
+MEDIA_X_SENDFILE = False
+
+# подключение кеширования бэкенда: файл SQLite общий для всех процессов,
+# поэтому кеш и сброс тегов работают одинаково во всех воркерах
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache_backends.sqlite.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'default.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
     }
 }
 
+# тесты получают свой кеш и MEDIA_ROOT; pytest подставляет их в conftest.py
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
+# сколько живут страницы в кеше с тегами: свежесть обеспечивает сброс
+# тегов сигналами, а не короткое время жизни
+TAGGED_CACHE_TIMEOUT = 60 * 60 * 24
+# сколько после этого ещё можно отдавать прежнюю копию, пока один запрос
+# строит новую
+TAGGED_CACHE_STALE = 60 * 10
+# на сколько секунд запрос берёт блокировку пересчёта страницы
+TAGGED_CACHE_LOCK_TIMEOUT = 30
+# сколько ждать страницу, которую строит другой запрос, если старой
+# копии нет
+TAGGED_CACHE_WAIT = 2
+# чем больше, тем раньше начинается досрочный пересчёт (XFetch)
+TAGGED_CACHE_EARLY_BETA = 1.0
+
+# сколько секунд хранить число постов ленты, для которой нет счётчика;
+# пока оно в кеше, число страниц показывается как примерное
+PAGINATOR_COUNT_TIMEOUT = 60
+
+# загрузка картинок: большая сторона уменьшается до IMAGE_MAX_SIDE, а
+# картинки больше IMAGE_MAX_PIXELS и анимации длиннее IMAGE_MAX_FRAMES
+# кадров отклоняются
+IMAGE_MAX_SIDE = 2560
+IMAGE_MAX_PIXELS = 24_000_000
+IMAGE_MAX_FRAMES = 100
+
+# миниатюры картинок строятся в фоновом пуле потоков после сохранения
+# поста; без фона (THUMBNAIL_BACKGROUND = False, так запускаются тесты) —
+# сразу, в том же потоке
+THUMBNAIL_BACKEND = 'posts.thumbnails.PostThumbnailBackend'
+THUMBNAIL_BACKGROUND = True
+THUMBNAIL_WORKERS = 2
+# метаданные миниатюр: хранилище sorl с LRU на столько записей в процессе
+THUMBNAIL_KVSTORE = 'posts.kvstore.LRUKVStore'
+THUMBNAIL_LRU_SIZE = 10000
+# сколько секунд верить записи LRU: другой процесс может удалить миниатюру
+THUMBNAIL_LRU_TIMEOUT = 60
+
+# лента подписок: авторы, у которых подписчиков не меньше порога, не
+# раскладываются по лентам при публикации, а читаются при показе ленты
+FEED_PULL_THRESHOLD = 10000
+# обратно в ленты автора раскладывает команда push_feeds (по расписанию),
+# когда подписчиков становится меньше этого порога; между порогами автор
+# не переключается, поэтому подписки и отписки у границы ничего не стоят
+FEED_PUSH_THRESHOLD = 8000
+# сколько строк ленты вставлять за один запрос
+FEED_BATCH_SIZE = 500
+# сколько секунд хранить в кеше списки подписок и подписчиков; ключ
+# меняется при каждой подписке, так что срок нужен только для вытеснения
+FOLLOW_GRAPH_TIMEOUT = 60 * 60 * 24
+
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
@@ -16,7 +16,9 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import include, path
 from django.conf import settings
-from django.conf.urls.static import static
+
+from core.media import serve_media
+from core.staticfiles import serve_static
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -24,6 +26,13 @@ urlpatterns = [
     path('auth/', include('users.urls', namespace='users')),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls', namespace='about')),
+    # картинки постов и миниатюры; в production их лучше отдавать
+    # веб-сервером через MEDIA_ACCEL_REDIRECT или MEDIA_X_SENDFILE
+    path(f'{settings.MEDIA_URL.lstrip("/")}<path:path>', serve_media,
+         name='media'),
+    # статика после collectstatic: файлы с хешем в имени и сжатые копии
+    path(f'{settings.STATIC_URL.lstrip("/")}<path:path>', serve_static,
+         name='static'),
 ]
 
 handler403 = 'core.views.permission_denied'
@@ -35,5 +44,3 @@ if settings.DEBUG:
 
     # запуск debug toolbar
     urlpatterns += (path('__debug__/', include(debug_toolbar.urls)),)
-    # отображение изображений в режиме Debug
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)